@@ -0,0 +1,99 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from flask import g
+from sqlalchemy import update
+
+# Import models
+from models import db, User
+
+ACTIVITY_FLUSH_INTERVAL = 60   # seconds between bulk UPDATEs
+ACTIVITY_SKIP_WINDOW = 300     # a user written this recently is not written again
+
+
+class ActivityTracker:
+    """
+    Keeps User.last_activity current without a write per request. Touches
+    are collected in memory and written by a background task as a single
+    UPDATE ... WHERE id IN (...) every ACTIVITY_FLUSH_INTERVAL seconds.
+    Users already written within ACTIVITY_SKIP_WINDOW are skipped, so
+    last_activity is accurate to a few minutes, which is all the reminder
+    jobs need.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self._touched = set()
+        self._written = {}  # user_id -> monotonic time of the last write
+        self._lock = threading.Lock()
+        self._started = False
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        app.after_request(self._touch_current_user)
+        atexit.register(self.flush)
+
+    def _touch_current_user(self, response):
+        # Only a user the request already authenticated; don't make
+        # anonymous requests load one
+        user = g.get('_login_user')
+        if user is not None and user.is_authenticated:
+            self.touch(user.id)
+        return response
+
+    def touch(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            written = self._written.get(user_id)
+            if written is not None and now - written < ACTIVITY_SKIP_WINDOW:
+                return
+            self._touched.add(user_id)
+            if not self._started:
+                self._started = True
+                self.socketio.start_background_task(self._run)
+
+    def flush(self):
+        """Write every pending touch in one UPDATE. Returns the number of users."""
+        now = time.monotonic()
+        with self._lock:
+            user_ids, self._touched = self._touched, set()
+            for user_id in user_ids:
+                self._written[user_id] = now
+            # Forget users whose skip window has passed
+            self._written = {
+                user_id: written for user_id, written in self._written.items()
+                if now - written < ACTIVITY_SKIP_WINDOW
+            }
+        if not user_ids:
+            return 0
+
+        try:
+            with self.app.app_context():
+                db.session.execute(
+                    update(User)
+                    .where(User.id.in_(sorted(user_ids)))
+                    .values(last_activity=datetime.utcnow()),
+                    # No response shows last_activity, keep cached ones valid
+                    execution_options={'synchronize_session': False, 'skip_cache_invalidation': True},
+                )
+                db.session.commit()
+        except Exception as e:
+            print(f'❌ Error updating last activity of {len(user_ids)} users: {e}')
+            with self._lock:
+                self._touched |= user_ids
+                for user_id in user_ids:
+                    self._written.pop(user_id, None)
+            return 0
+        return len(user_ids)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(ACTIVITY_FLUSH_INTERVAL)
+            self.flush()
+
+
+activity_tracker = ActivityTracker()
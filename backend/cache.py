@@ -1,2 +1,272 @@
+import functools
+import hashlib
+import os
+import secrets
+import shlex
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app, make_response, request
 from flask_caching import Cache
-cache = Cache() 
\ No newline at end of file
+from flask_caching.backends.base import BaseCache
+from flask_security import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from realtime import SOCKETIO_MESSAGE_QUEUE
+
+cache = Cache()
+
+
+class LRUCache(BaseCache):
+    """
+    Thread-safe in-process cache that evicts the least recently used entry
+    once `threshold` entries are stored. Only suitable for a single process;
+    use RedisCache when several workers or nodes serve traffic.
+    """
+
+    def __init__(self, threshold=1000, default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self._threshold = threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(threshold=config['CACHE_THRESHOLD'])
+        return cls(*args, **kwargs)
+
+    def _expires_at(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.monotonic() + timeout if timeout > 0 else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._entries[key] = (self._expires_at(timeout), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._threshold:
+                self._entries.popitem(last=False)
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if key in self._entries:
+                expires_at, _ = self._entries[key]
+                if expires_at is None or expires_at > time.monotonic():
+                    return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def has(self, key):
+        return self.get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return True
+
+
+# ---------------------------------------------------------------------------
+# Table versions
+#
+# Every table has an opaque version token in the cache. Cached responses are
+# keyed on the versions of the tables they read, so committing a write to a
+# table makes every response built from it unreachable at once. Tokens are
+# random rather than counters so that a version evicted from the cache (or
+# lost on restart) can never come back equal to an older one.
+# ---------------------------------------------------------------------------
+
+def _version_key(table):
+    return f'version:{table}'
+
+
+def table_versions(*tables):
+    """Current version token of each table, in one cache round trip."""
+    versions = dict(zip(tables, cache.get_many(*[_version_key(t) for t in tables])))
+    for table, version in versions.items():
+        if version is None:
+            cache.add(_version_key(table), secrets.token_hex(8), timeout=0)
+            versions[table] = cache.get(_version_key(table))
+    return versions
+
+
+def bump_table_versions(*tables):
+    """Invalidate every cached response that depends on one of the tables."""
+    if tables:
+        cache.set_many({_version_key(t): secrets.token_hex(8) for t in tables}, timeout=0)
+
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+def _track_flush(session, flush_context):
+    changed = _changed_tables(session)
+    for obj in session.new | session.deleted:
+        changed.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            changed.add(obj.__table__.name)
+
+
+def _track_bulk_statement(orm_execute_state):
+    # Query.update()/delete() and update()/delete() statements skip the flush.
+    # Writes to columns no response shows can opt out with the
+    # skip_cache_invalidation execution option.
+    if orm_execute_state.execution_options.get('skip_cache_invalidation'):
+        return
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _changed_tables(orm_execute_state.session).add(mapper.local_table.name)
+
+
+def _bump_after_commit(session):
+    changed = session.info.pop('changed_tables', None)
+    if changed:
+        bump_table_versions(*sorted(changed))
+
+
+def _forget_after_rollback(session):
+    session.info.pop('changed_tables', None)
+
+
+def _web_workers():
+    """Web worker processes configured through WEB_CONCURRENCY or gunicorn's -w/--workers."""
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    args = shlex.split(os.getenv('GUNICORN_CMD_ARGS', ''))
+    if 'gunicorn' in os.path.basename(sys.argv[0]):
+        args += sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg in ('-w', '--workers') and i + 1 < len(args):
+            workers = int(args[i + 1])
+        elif arg.startswith('--workers='):
+            workers = int(arg.split('=', 1)[1])
+    return workers
+
+
+def _other_web_processes():
+    """Why other web processes may write to the database, or None."""
+    # Kombu's memory:// transport never leaves this process
+    if SOCKETIO_MESSAGE_QUEUE and not SOCKETIO_MESSAGE_QUEUE.startswith('memory://'):
+        return 'SOCKETIO_MESSAGE_QUEUE is set'
+    workers = _web_workers()
+    if workers > 1:
+        return f'{workers} web workers are configured'
+    return None
+
+
+def init_cache(app):
+    """
+    Configure the response cache and invalidate it on every committed write.
+
+    CACHE_REDIS_URL switches to a Redis-compatible backend shared by all
+    workers; otherwise an in-process LRU is used. Table versions bumped in
+    one process are invisible to every other, so when several web processes
+    serve traffic without CACHE_REDIS_URL, response caching is turned off
+    (RESPONSE_CACHE_ENABLED) rather than serving stale bodies and 304s.
+    """
+    app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+    app.config.setdefault('CACHE_THRESHOLD', 1000)
+    app.config.setdefault('CACHE_KEY_PREFIX', 'inspap:')
+    app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+    if app.config.get('CACHE_REDIS_URL'):
+        app.config.setdefault('CACHE_TYPE', 'RedisCache')
+    else:
+        app.config.setdefault('CACHE_TYPE', 'cache.LRUCache')
+        reason = _other_web_processes()
+        if reason and app.config['RESPONSE_CACHE_ENABLED']:
+            print(f'⚠️ Response caching disabled: {reason} but CACHE_REDIS_URL is not, '
+                  f'so invalidations would not reach the other processes')
+            app.config['RESPONSE_CACHE_ENABLED'] = False
+    cache.init_app(app)
+
+    if not event.contains(Session, 'after_flush', _track_flush):
+        event.listen(Session, 'after_flush', _track_flush)
+        event.listen(Session, 'do_orm_execute', _track_bulk_statement)
+        event.listen(Session, 'after_commit', _bump_after_commit)
+        event.listen(Session, 'after_rollback', _forget_after_rollback)
+
+
+def _response_fingerprint(f, tables, per_user):
+    """Digest of the view, URL, caller and table versions a response depends on."""
+    versions = table_versions(*tables)
+    parts = [f.__qualname__, request.full_path]
+    if per_user:
+        parts.append(str(current_user.id))
+    parts.extend(f'{table}={versions[table]}' for table in tables)
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def cached_response(*tables, timeout=None, per_user=False):
+    """
+    Cache a resource method's successful response until one of `tables` is
+    written to. Use per_user=True when the response depends on who is asking.
+    Place it below the auth decorators so access checks still run on a hit.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['RESPONSE_CACHE_ENABLED']:
+                return f(*args, **kwargs)
+            key = 'response:' + _response_fingerprint(f, tables, per_user)
+
+            cached = cache.get(key)
+            if cached is not None:
+                body, status, mimetype = cached
+                response = Response(body, status=status, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                cache.set(key, (response.get_data(), response.status_code, response.mimetype),
+                          timeout=timeout)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def etag_response(*tables, per_user=True):
+    """
+    Tag a resource method's response with a strong ETag derived from the
+    version tokens of `tables`, and answer If-None-Match with 304 Not Modified
+    before the view runs any query. Place it below the auth decorators.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['RESPONSE_CACHE_ENABLED']:
+                return f(*args, **kwargs)
+            etag = _response_fingerprint(f, tables, per_user)
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            # Let browsers keep the body but revalidate on every poll
+            response.headers['Cache-Control'] = 'private, no-cache' if per_user else 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,289 @@
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from sqlalchemy import and_, case, delete, event, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Import models
+from models import db, Brand, Campaign, ChatMessage, Influencer, Proposal, UnreadCounter, User, get_ist_time
+
+
+# Proposal participants rarely change, so the send path keeps them in a
+# bounded per-process LRU. Deletes in this process invalidate entries at
+# once; the TTL bounds how long another worker's delete can go unnoticed.
+PARTICIPANT_CACHE_SIZE = 10000
+PARTICIPANT_CACHE_TTL = 300
+
+ProposalParticipants = namedtuple(
+    'ProposalParticipants', ['influencer_user_id', 'brand_user_id', 'campaign_id']
+)
+
+
+class ParticipantCache:
+    """proposal_id -> ProposalParticipants, least recently used evicted first."""
+
+    def __init__(self, size=PARTICIPANT_CACHE_SIZE, ttl=PARTICIPANT_CACHE_TTL):
+        self._size = size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, proposal_id):
+        with self._lock:
+            entry = self._entries.get(proposal_id)
+            if entry is None:
+                return None
+            expires_at, participants = entry
+            if expires_at <= time.monotonic():
+                del self._entries[proposal_id]
+                return None
+            self._entries.move_to_end(proposal_id)
+            return participants
+
+    def set(self, proposal_id, participants):
+        with self._lock:
+            self._entries[proposal_id] = (time.monotonic() + self._ttl, participants)
+            self._entries.move_to_end(proposal_id)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def discard(self, proposal_id):
+        with self._lock:
+            self._entries.pop(proposal_id, None)
+
+    def discard_campaign(self, campaign_id):
+        with self._lock:
+            stale = [proposal_id for proposal_id, (_, participants) in self._entries.items()
+                     if participants.campaign_id == campaign_id]
+            for proposal_id in stale:
+                del self._entries[proposal_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+participant_cache = ParticipantCache()
+
+
+@event.listens_for(Proposal, 'after_delete')
+def _forget_proposal(mapper, connection, proposal):
+    participant_cache.discard(proposal.id)
+
+
+@event.listens_for(Campaign, 'after_delete')
+def _forget_campaign(mapper, connection, campaign):
+    participant_cache.discard_campaign(campaign.id)
+
+
+def proposal_participants(proposal_id):
+    """
+    (influencer_user_id, brand_user_id, campaign_id) of a proposal, from the
+    participant cache or one joined query. None if the proposal doesn't exist.
+    """
+    participants = participant_cache.get(proposal_id)
+    if participants is None:
+        row = db.session.execute(
+            select(Influencer.user_id, Brand.user_id, Proposal.campaign_id)
+            .select_from(Proposal)
+            .join(Influencer, Influencer.id == Proposal.influencer_id)
+            .join(Campaign, Campaign.id == Proposal.campaign_id)
+            .join(Brand, Brand.id == Campaign.brand_id)
+            .where(Proposal.id == proposal_id)
+        ).first()
+        if row is None:
+            return None
+        participants = ProposalParticipants(*row)
+        participant_cache.set(proposal_id, participants)
+    return participants
+
+
+def upsert(model):
+    """INSERT ... ON CONFLICT for the session's dialect."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql_insert(model)
+    if dialect == 'sqlite':
+        return sqlite_insert(model)
+    raise RuntimeError(f'Upserts are not supported on {dialect}')
+
+
+def increment_unread(recipient_id, proposal_id, by=1):
+    """
+    Add `by` to the recipient's unread count for the proposal with a single
+    upsert. Runs in the caller's transaction, so commit it together with the
+    ChatMessage insert.
+    """
+    stmt = upsert(UnreadCounter).values(recipient_id=recipient_id, proposal_id=proposal_id, count=by)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UnreadCounter.recipient_id, UnreadCounter.proposal_id],
+        set_={'count': UnreadCounter.count + stmt.excluded.count},
+    )
+    db.session.execute(stmt)
+
+
+def _decrement_unread(recipient_id, counts):
+    # Never below zero, even if the counter drifted from the messages
+    for proposal_id, read in counts.items():
+        db.session.execute(
+            update(UnreadCounter)
+            .where(UnreadCounter.recipient_id == recipient_id,
+                   UnreadCounter.proposal_id == proposal_id)
+            .values(count=case((UnreadCounter.count > read, UnreadCounter.count - read), else_=0)),
+            execution_options={'synchronize_session': False},
+        )
+
+
+def mark_messages_read(recipient_id, proposal_id, message_ids=None, up_to_id=None):
+    """
+    Mark the recipient's unread messages as read in one UPDATE and return
+    the ids that actually changed.
+
+    Either pass explicit message_ids, or up_to_id to mark every message of
+    the proposal up to and including that one (a read watermark). The
+    watermark follows chat order, (timestamp, id), since ids handed out by
+    the write-behind queue are only ordered within one worker.
+    """
+    stmt = update(ChatMessage).where(
+        ChatMessage.recipient_id == recipient_id,
+        ChatMessage.read == False
+    )
+    if up_to_id is not None:
+        watermark = select(ChatMessage.timestamp).where(ChatMessage.id == up_to_id).scalar_subquery()
+        stmt = stmt.where(
+            ChatMessage.proposal_id == proposal_id,
+            or_(ChatMessage.timestamp < watermark,
+                and_(ChatMessage.timestamp == watermark, ChatMessage.id <= up_to_id)),
+        )
+    elif message_ids:
+        stmt = stmt.where(ChatMessage.id.in_(message_ids))
+    else:
+        return []
+
+    stmt = stmt.values(read=True, read_at=get_ist_time()).returning(ChatMessage.id, ChatMessage.proposal_id)
+    rows = db.session.execute(
+        stmt, execution_options={'synchronize_session': False}
+    ).all()
+    _decrement_unread(recipient_id, Counter(row.proposal_id for row in rows))
+    db.session.commit()
+    return sorted(row.id for row in rows)
+
+
+def unread_counts(recipient_id):
+    """{proposal_id: count} of every proposal with unread messages for the user."""
+    rows = db.session.execute(
+        select(UnreadCounter.proposal_id, UnreadCounter.count)
+        .where(UnreadCounter.recipient_id == recipient_id, UnreadCounter.count > 0)
+    ).all()
+    return {row.proposal_id: row.count for row in rows}
+
+
+def rebuild_unread_counters():
+    """Recount every unread counter from ChatMessage. Returns the rows written."""
+    db.session.execute(delete(UnreadCounter))
+    unread = (
+        select(ChatMessage.recipient_id, ChatMessage.proposal_id, func.count(ChatMessage.id))
+        .where(ChatMessage.read == False)
+        .group_by(ChatMessage.recipient_id, ChatMessage.proposal_id)
+    )
+    result = db.session.execute(
+        insert(UnreadCounter).from_select(['recipient_id', 'proposal_id', 'count'], unread)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def inbox_page(identity, limit, before=None):
+    """
+    One page of the user's conversations, most recently active first: the
+    latest message of every proposal they take part in that has messages,
+    with the campaign, the other party and the unread count.
+
+    The latest message comes from a row_number() window over
+    (proposal_id, timestamp), so the page is a single query. `before` is the
+    (timestamp, message_id) of the last row of the previous page. Returns
+    (rows, has_more).
+    """
+    latest = select(
+        ChatMessage.id,
+        ChatMessage.proposal_id,
+        ChatMessage.sender_id,
+        ChatMessage.message,
+        ChatMessage.timestamp,
+        ChatMessage.file_name,
+        ChatMessage.file_type,
+        func.row_number().over(
+            partition_by=ChatMessage.proposal_id,
+            order_by=(ChatMessage.timestamp.desc(), ChatMessage.id.desc()),
+        ).label('position'),
+    ).join(Proposal, Proposal.id == ChatMessage.proposal_id)
+    if identity.influencer:
+        latest = latest.where(Proposal.influencer_id == identity.influencer.id)
+    elif identity.brand:
+        latest = latest.join(Campaign, Campaign.id == Proposal.campaign_id) \
+            .where(Campaign.brand_id == identity.brand.id)
+    else:
+        return [], False
+    latest = latest.subquery()
+
+    query = select(
+        latest,
+        Proposal.campaign_id,
+        Proposal.status,
+        Campaign.title.label('campaign_title'),
+        Brand.name.label('brand_name'),
+        User.username.label('influencer_name'),
+        func.coalesce(UnreadCounter.count, 0).label('unread'),
+    ).join(Proposal, Proposal.id == latest.c.proposal_id) \
+        .join(Campaign, Campaign.id == Proposal.campaign_id) \
+        .join(Brand, Brand.id == Campaign.brand_id) \
+        .join(Influencer, Influencer.id == Proposal.influencer_id) \
+        .join(User, User.id == Influencer.user_id) \
+        .outerjoin(UnreadCounter, and_(
+            UnreadCounter.recipient_id == identity.user_id,
+            UnreadCounter.proposal_id == latest.c.proposal_id,
+        )) \
+        .where(latest.c.position == 1)
+
+    if before:
+        timestamp, message_id = before
+        query = query.where(or_(
+            latest.c.timestamp < timestamp,
+            and_(latest.c.timestamp == timestamp, latest.c.id < message_id),
+        ))
+
+    rows = db.session.execute(
+        query.order_by(latest.c.timestamp.desc(), latest.c.id.desc()).limit(limit + 1)
+    ).all()
+    return rows[:limit], len(rows) > limit
+
+
+def messages_since(proposal_id, after, read_after, limit):
+    """
+    What changed in a proposal's chat since a client last synced: messages
+    after the `after` (timestamp, id) position in chat order, and messages
+    whose read receipt was set after the `read_after` (read_at, id) position.
+    Each list holds at most `limit` rows, oldest first. Returns
+    (messages, receipts, has_more).
+    """
+    after_ts, after_id = after
+    messages = ChatMessage.query.filter(
+        ChatMessage.proposal_id == proposal_id,
+        or_(ChatMessage.timestamp > after_ts,
+            and_(ChatMessage.timestamp == after_ts, ChatMessage.id > after_id)),
+    ).order_by(ChatMessage.timestamp, ChatMessage.id).limit(limit + 1).all()
+
+    read_ts, read_id = read_after
+    receipts = db.session.execute(
+        select(ChatMessage.id, ChatMessage.read_at)
+        .where(ChatMessage.proposal_id == proposal_id,
+               or_(ChatMessage.read_at > read_ts,
+                   and_(ChatMessage.read_at == read_ts, ChatMessage.id > read_id)))
+        .order_by(ChatMessage.read_at, ChatMessage.id)
+        .limit(limit + 1)
+    ).all()
+
+    has_more = len(messages) > limit or len(receipts) > limit
+    return messages[:limit], receipts[:limit], has_more
@@ -0,0 +1,201 @@
+import atexit
+import threading
+from collections import Counter
+
+from sqlalchemy import case, func, insert, select, text
+from sqlalchemy.exc import DataError, IntegrityError
+
+from chat import increment_unread, upsert
+from uploads import change_references
+# Import models
+from models import db, ChatMessage, IdBlock, get_ist_time
+
+CHAT_MESSAGE_COLUMNS = (
+    'id', 'proposal_id', 'sender_id', 'recipient_id', 'message', 'timestamp',
+    'read', 'file_url', 'file_name', 'file_type', 'file_size',
+)
+
+
+class ChatWriter:
+    """
+    Optional write-behind queue for chat messages (CHAT_WRITE_BEHIND).
+
+    Messages get their id from a block reserved ahead (from the id column's
+    sequence on Postgres, from IdBlock elsewhere), so they can be broadcast
+    right away, and are written by a background task in one multi-row
+    INSERT per batch. A batch is flushed every
+    CHAT_FLUSH_INTERVAL seconds or once CHAT_FLUSH_BATCH_SIZE messages are
+    waiting. A batch that fails is written again row by row: rows the
+    database rejects (e.g. their proposal was deleted meanwhile) are
+    dropped and logged, the rest are kept for the next flush if the
+    database is unreachable.
+
+    CHAT_MAX_PENDING caps how many acknowledged messages can exist only in
+    memory: at the cap the sender flushes synchronously, and if the queue
+    still doesn't drain its message is inserted directly, so it is never
+    acknowledged unwritten. Pending messages are flushed at interpreter exit.
+
+    When disabled, save() inserts and commits straight away.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.enabled = False
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._ids = iter(())
+        self._started = False
+
+    def init_app(self, app, socketio):
+        app.config.setdefault('CHAT_WRITE_BEHIND', False)
+        app.config.setdefault('CHAT_FLUSH_INTERVAL', 0.05)
+        app.config.setdefault('CHAT_FLUSH_BATCH_SIZE', 200)
+        app.config.setdefault('CHAT_MAX_PENDING', 1000)
+        app.config.setdefault('CHAT_ID_BLOCK_SIZE', 100)
+        self.app = app
+        self.socketio = socketio
+        self.enabled = bool(app.config['CHAT_WRITE_BEHIND'])
+        if self.enabled:
+            atexit.register(self.flush)
+
+    def _reserve_block(self):
+        """Reserve the next CHAT_ID_BLOCK_SIZE message ids for this process."""
+        size = self.app.config['CHAT_ID_BLOCK_SIZE']
+        if db.engine.dialect.name == 'postgresql':
+            # Draw them from the id column's own sequence, so inserts that
+            # leave the id to the database (write-behind off) never collide
+            with db.engine.begin() as conn:
+                ids = conn.execute(text(
+                    "SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :size)"
+                ), {'table': ChatMessage.__tablename__, 'size': size}).scalars().all()
+            return iter(sorted(ids))
+
+        # Never hand out ids below rows inserted with autoincrement, e.g.
+        # while write-behind was disabled
+        floor = select(func.coalesce(func.max(ChatMessage.id), 0) + 1).scalar_subquery()
+        stmt = upsert(IdBlock).values(name=ChatMessage.__tablename__, next_id=floor + size)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IdBlock.name],
+            set_={'next_id': case((IdBlock.next_id > floor, IdBlock.next_id), else_=floor) + size},
+        ).returning(IdBlock.next_id)
+        # Own transaction, so the block is never rolled back with the caller
+        with db.engine.begin() as conn:
+            end = conn.execute(stmt).scalar_one()
+        return iter(range(end - size, end))
+
+    def _next_id(self):
+        with self._lock:
+            message_id = next(self._ids, None)
+            if message_id is None:
+                self._ids = self._reserve_block()
+                message_id = next(self._ids)
+            return message_id
+
+    def save(self, **fields):
+        """
+        Store a chat message and bump the recipient's unread counter.
+        Returns (message_id, timestamp) for the broadcast.
+        """
+        fields.setdefault('timestamp', get_ist_time())
+        fields.setdefault('read', False)
+
+        if not self.enabled:
+            return self._save_now(fields)
+
+        # Back-pressure: never hold more than the ceiling unwritten
+        if self._pending_count() >= self.app.config['CHAT_MAX_PENDING']:
+            self.flush()
+            if self._pending_count() >= self.app.config['CHAT_MAX_PENDING']:
+                # The queue can't drain, write this one before acknowledging it
+                fields['id'] = self._next_id()
+                return self._save_now(fields)
+
+        fields['id'] = self._next_id()
+        row = {column: fields.get(column) for column in CHAT_MESSAGE_COLUMNS}
+        with self._lock:
+            self._pending.append(row)
+            pending = len(self._pending)
+            if not self._started:
+                self._started = True
+                self.socketio.start_background_task(self._run)
+
+        if pending >= self.app.config['CHAT_FLUSH_BATCH_SIZE']:
+            self.socketio.start_background_task(self.flush)
+        return row['id'], row['timestamp']
+
+    def _save_now(self, fields):
+        message = ChatMessage(**fields)
+        try:
+            db.session.add(message)
+            db.session.flush()
+            # Read these before commit expires them, which would cost a SELECT
+            message_id, timestamp = message.id, message.timestamp
+            increment_unread(fields['recipient_id'], fields['proposal_id'])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return message_id, timestamp
+
+    def _pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _write(self, rows):
+        """Insert `rows` with their unread counts and file references, in one transaction."""
+        batch_size = self.app.config['CHAT_FLUSH_BATCH_SIZE']
+        try:
+            for start in range(0, len(rows), batch_size):
+                db.session.execute(insert(ChatMessage).values(rows[start:start + batch_size]))
+            unread = Counter((row['recipient_id'], row['proposal_id']) for row in rows)
+            for (recipient_id, proposal_id), count in unread.items():
+                increment_unread(recipient_id, proposal_id, by=count)
+            # Core inserts skip the ORM events that count file references
+            change_references(db.session, [row['file_url'] for row in rows], 1)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def flush(self):
+        """Write every pending message. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+
+            with self.app.app_context():
+                try:
+                    self._write(rows)
+                    return len(rows)
+                except Exception as e:
+                    print(f'❌ Error writing {len(rows)} chat messages, retrying one by one: {e}')
+
+                written = 0
+                for index, row in enumerate(rows):
+                    try:
+                        self._write([row])
+                        written += 1
+                    except (IntegrityError, DataError) as e:
+                        # This row can never be written; don't let it block the rest
+                        print(f'❌ Dropping chat message {row["id"]}, rejected by the database: {row} ({e})')
+                    except Exception as e:
+                        print(f'❌ Error writing {len(rows) - index} chat messages, will retry: {e}')
+                        with self._lock:
+                            self._pending[:0] = rows[index:]
+                        break
+                return written
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.app.config['CHAT_FLUSH_INTERVAL'])
+            with self._lock:
+                pending = len(self._pending)
+            if pending:
+                self.flush()
+
+
+chat_writer = ChatWriter()
@@ -0,0 +1,13 @@
+"""
+Point the app at a throwaway SQLite database and upload folders before any
+test module imports main, which builds the app at import time.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix='inspap-test-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp, "test.db")}'
+os.environ['UPLOAD_FOLDER'] = os.path.join(_tmp, 'uploads') + '/'
+os.environ['UPLOAD_TEMP_FOLDER'] = os.path.join(_tmp, 'uploads_tmp') + '/'
+# Flask-SocketIO's test client can't run against a message queue
+os.environ.pop('SOCKETIO_MESSAGE_QUEUE', None)
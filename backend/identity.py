@@ -0,0 +1,69 @@
+from flask import current_app, g
+from flask_security import current_user
+
+
+class Identity:
+    """A user together with their influencer or brand profile."""
+
+    def __init__(self, user):
+        self.user = user
+        # User.type says which profile exists, so only that one is loaded
+        self.influencer = user.influencer if user.type == 'influencer' else None
+        self.brand = user.brand if user.type == 'brand' else None
+
+    @property
+    def user_id(self):
+        return self.user.id
+
+    @property
+    def role(self):
+        return self.user.type
+
+    @property
+    def profile(self):
+        return self.influencer or self.brand
+
+    def can_access_proposal(self, proposal):
+        """True if this user is the influencer or the brand on the proposal."""
+        if self.influencer:
+            return proposal.influencer_id == self.influencer.id
+        if self.brand:
+            return proposal.campaign.brand_id == self.brand.id
+        return False
+
+    def __repr__(self):
+        return f'<Identity {self.role} {self.user_id}>'
+
+
+def _identities():
+    # g lives for one HTTP request or one Socket.IO event
+    if 'identities' not in g:
+        g.identities = {}
+    return g.identities
+
+
+def current_identity():
+    """Identity of the authenticated current_user, resolved once per request."""
+    identities = _identities()
+    identity = identities.get(current_user.id)
+    if identity is None:
+        identity = identities[current_user.id] = Identity(current_user)
+    return identity
+
+
+def user_for_token(token):
+    """
+    The active user an Authentication-Token belongs to, or None. Does what
+    @auth_required('token') does for HTTP, for callers without a request
+    header such as a Socket.IO handshake.
+    """
+    security = current_app.extensions['security']
+    try:
+        data = security.remember_token_serializer.loads(token, max_age=security.token_max_age)
+        # Tokens from Flask-Security 3.x carry the uniquifier as their third element
+        user = security.datastore.find_user(fs_uniquifier=data[0 if len(data) == 1 else 2])
+    except Exception:
+        return None
+    if user is None or not user.active or not user.verify_auth_token(data):
+        return None
+    return user
@@ -0,0 +1,98 @@
+import os
+import tempfile
+from datetime import datetime
+
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy import select, update
+
+# Import models
+from models import db, StoredFile
+from uploads import IMAGE_EXTENSIONS, THUMBNAIL_SIZES, thumbnail_path
+
+THUMBNAIL_QUALITY = 80
+DERIVATIVE_BATCH_SIZE = 50
+
+
+def _output_mode(image):
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        return 'RGBA'
+    return 'RGB'
+
+
+def _write(image, destination):
+    # Written next to the destination and renamed, so a half-written
+    # thumbnail is never served
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+        os.replace(temp, destination)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def make_derivatives(path):
+    """
+    Write every THUMBNAIL_SIZES thumbnail of the stored image at `path`.
+    Pixels are copied into a fresh image, so EXIF (camera, GPS), ICC and
+    other metadata are left behind; EXIF orientation is applied first.
+    Returns the number of thumbnails written.
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    with Image.open(os.path.join(folder, path)) as original:
+        # JPEGs can be decoded straight at a fraction of their size
+        original.draft('RGB', (max(THUMBNAIL_SIZES),) * 2)
+        image = ImageOps.exif_transpose(original)
+        mode = _output_mode(image)
+        image = image.convert(mode)
+
+    written = 0
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        # Each size is scaled down from the previous, larger one
+        image.thumbnail((size, size), Image.LANCZOS)
+        clean = Image.new(mode, image.size)
+        clean.paste(image)
+        _write(clean, os.path.join(folder, thumbnail_path(path, size)))
+        written += 1
+    return written
+
+
+def process_stored_image(path):
+    """
+    Make the thumbnails of one stored image and record it. An image Pillow
+    can't read is recorded too, so it isn't retried; its thumbnail URLs keep
+    redirecting to the original.
+    """
+    try:
+        written = make_derivatives(path)
+    except FileNotFoundError:
+        # Swept before its turn came
+        return 0
+    except Exception as e:
+        print(f'❌ Error making thumbnails of {path}: {e}')
+        written = 0
+    db.session.execute(
+        update(StoredFile.__table__)
+        .where(StoredFile.__table__.c.path == path)
+        .values(derivatives_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return written
+
+
+def process_missing_derivatives(limit=DERIVATIVE_BATCH_SIZE):
+    """Make thumbnails for stored images that have none yet. Returns the number of images."""
+    table = StoredFile.__table__
+    extensions = [table.c.path.like(f'%.{extension}') for extension in IMAGE_EXTENSIONS]
+    paths = db.session.execute(
+        select(table.c.path)
+        .where(table.c.derivatives_at.is_(None), db.or_(*extensions))
+        .order_by(table.c.last_stored_at)
+        .limit(limit)
+    ).scalars().all()
+    for path in paths:
+        process_stored_image(path)
+    return len(paths)
@@ -1,4 +1,12 @@
-from flask import Flask, send_from_directory, render_template
+if __name__ == '__main__':
+    # socketio.run() serves with eventlet, which needs the standard library
+    # patched before anything else is imported (the Redis message queue
+    # listener would block the hub otherwise). gunicorn's eventlet worker
+    # patches by itself.
+    import eventlet
+    eventlet.monkey_patch()
+
+from flask import Flask, abort, redirect, send_from_directory, render_template, request, session
 from flask_security import Security
 from flask_login import LoginManager
 from flask_cors import CORS
@@ -7,9 +15,18 @@ from flask_sqlalchemy import SQLAlchemy
 import os
 from flask_restful import Api
 from worker import celery_init_app
-from tasks import monthly_reminder, daily_reminder
+from tasks import monthly_reminder, daily_reminder, purge_expired_reset_tokens, purge_expired_uploads, sweep_unreferenced_files, make_missing_image_derivatives, refresh_match_recommendations
 from flask_socketio import SocketIO
 import pytz
+from querystats import init_query_stats, QUERY_COUNT_HEADER, QUERY_TIME_HEADER
+from cache import init_cache
+from chat import mark_messages_read, proposal_participants
+from chatwriter import chat_writer
+from identity import Identity, user_for_token
+from activity import activity_tracker
+from realtime import register_local_server, socketio_queue_options, typing_coalescer
+from uploads import PREVIEW_SIZE, thumbnail_source, thumbnail_url
+from werkzeug.utils import safe_join
 
 # Initialize SQLAlchemy
 db = SQLAlchemy()
@@ -39,8 +56,20 @@ def create_app():
     app.config['WTF_CSRF_ENABLED'] = False
     app.config['SECURITY_TOKEN_AUTHENTICATION_HEADER'] = 'Authentication-Token'
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads/')  # For image uploads
+    app.config['UPLOAD_TEMP_FOLDER'] = os.getenv('UPLOAD_TEMP_FOLDER', 'uploads_tmp/')  # Resumable uploads in progress
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB limit
 
+    # Response cache: in-process LRU for a single node, Redis when several
+    # workers or nodes must share invalidations (without it, caching turns
+    # itself off when SOCKETIO_MESSAGE_QUEUE or WEB_CONCURRENCY > 1 is set)
+    if os.getenv('CACHE_REDIS_URL'):
+        app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL')
+
+    # Chat write-behind: acknowledge messages at once, insert them in batches
+    app.config['CHAT_WRITE_BEHIND'] = os.getenv('CHAT_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    app.config['CHAT_FLUSH_INTERVAL'] = float(os.getenv('CHAT_FLUSH_INTERVAL', 0.05))
+    app.config['CHAT_MAX_PENDING'] = int(os.getenv('CHAT_MAX_PENDING', 1000))
+
     # Ensure the upload folder exists
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -57,12 +86,15 @@ def create_app():
             ],
             "supports_credentials": True,
             "allow_headers": ["Content-Type", "Authorization", "Authentication-Token"],
+            "expose_headers": [QUERY_COUNT_HEADER, QUERY_TIME_HEADER, "ETag"],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"]
         }
     })
 
     # Initialize components
     db.init_app(app)
+    init_query_stats(app, db)
+    init_cache(app)
     api.init_app(app)
     app.security = Security(app, datastore)
 
@@ -70,6 +102,15 @@ def create_app():
     @app.route('/uploads/<path:filename>')
     def download_file(filename):
         filename = filename.replace('uploads/images/', '')
+        if filename.startswith(('blobs/', 'thumbs/')):
+            # Content-addressed: the bytes behind this name never change
+            if filename.startswith('thumbs/') and not os.path.isfile(safe_join(app.config['UPLOAD_FOLDER'], filename) or ''):
+                # Not made yet: send the original, uncached, until it is
+                original = thumbnail_source(filename)
+                if original is None:
+                    abort(404)
+                return redirect(f'/uploads/{original}')
+            return send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=31536000)
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
     # React frontend will be served by Vercel separately
@@ -84,26 +125,63 @@ def create_app():
 app = create_app()
 celery_app = celery_init_app(app)
 
-# Initialize Socket.IO with the app
+# Initialize Socket.IO with the app. With SOCKETIO_MESSAGE_QUEUE set, rooms
+# are shared by every web worker and by emits from Celery tasks.
 socketio = SocketIO(app, 
     cors_allowed_origins="*",  # Allow all origins for development
     async_mode='eventlet',  # Use eventlet for better performance
     logger=False,
-    engineio_logger=False
+    engineio_logger=False,
+    **socketio_queue_options()
 )
+register_local_server(socketio)
+chat_writer.init_app(app, socketio)
+typing_coalescer.init_app(socketio)
+activity_tracker.init_app(app, socketio)
 
 @celery_app.on_after_configure.connect
 def celery_job(sender, **kwargs):
     # for testing
     sender.add_periodic_task(60, monthly_reminder.s())
     sender.add_periodic_task(40, daily_reminder.s())
+    sender.add_periodic_task(3600, purge_expired_reset_tokens.s())
+    sender.add_periodic_task(3600, purge_expired_uploads.s())
+    sender.add_periodic_task(3600, sweep_unreferenced_files.s())
+    sender.add_periodic_task(600, make_missing_image_derivatives.s())
+    sender.add_periodic_task(1800, refresh_match_recommendations.s())
 
 # Socket.IO event handlers
 from flask_socketio import join_room, leave_room, emit
 
+# The socket's user is resolved once at connect and kept in its session
+# (Flask-SocketIO gives every connection its own copy of the session), with
+# the chat rooms it was allowed into. Events never trust user ids sent in
+# the payload.
+
+def chat_room(data):
+    """Room name of the event's proposal chat if this socket joined it, else None."""
+    room = f"chat_{data.get('campaign_id')}_{data.get('proposal_id')}"
+    return room if room in session.get('chat_rooms', ()) else None
+
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected')
+def handle_connect(auth=None):
+    """Authenticate with the Authentication-Token (auth={'token': ...} or header)"""
+    token = (auth or {}).get('token') or request.headers.get('Authentication-Token')
+    user = user_for_token(token) if token else None
+    if user is None:
+        print('Client rejected: missing or invalid token')
+        return False
+    
+    identity = Identity(user)
+    session['identity'] = {
+        'user_id': identity.user_id,
+        'role': identity.role,
+        'influencer_id': identity.influencer.id if identity.influencer else None,
+        'brand_id': identity.brand.id if identity.brand else None,
+    }
+    session['chat_rooms'] = set()
+    activity_tracker.touch(user.id)
+    print(f'Client connected: user {user.id}')
     emit('connected', {'message': 'Successfully connected to chat server'})
 
 @socketio.on('disconnect')
@@ -116,6 +194,20 @@ def handle_join_chat(data):
     campaign_id = data.get('campaign_id')
     proposal_id = data.get('proposal_id')
     room = f'chat_{campaign_id}_{proposal_id}'
+    
+    # Membership is checked once here; later events only look at the session
+    try:
+        participants = proposal_participants(int(proposal_id))
+    except (TypeError, ValueError):
+        participants = None
+    if not participants or str(participants.campaign_id) != str(campaign_id):
+        emit('error', {'message': 'Proposal not found'})
+        return
+    if session['identity']['user_id'] not in (participants.influencer_user_id, participants.brand_user_id):
+        emit('error', {'message': 'Unauthorized to join this room'})
+        return
+    
+    session['chat_rooms'].add(room)
     join_room(room)
     print(f'User joined room: {room}')
     emit('joined_chat', {'room': room, 'message': 'Joined chat successfully'}, room=room)
@@ -123,55 +215,50 @@ def handle_join_chat(data):
 @socketio.on('leave_chat')
 def handle_leave_chat(data):
     """Leave a chat room"""
-    campaign_id = data.get('campaign_id')
-    proposal_id = data.get('proposal_id')
-    room = f'chat_{campaign_id}_{proposal_id}'
+    room = chat_room(data)
+    if not room:
+        return
+    session['chat_rooms'].discard(room)
     leave_room(room)
     print(f'User left room: {room}')
     emit('left_chat', {'room': room}, room=room)
 
 @socketio.on('typing')
 def handle_typing(data):
-    """Handle typing indicator"""
-    campaign_id = data.get('campaign_id')
-    proposal_id = data.get('proposal_id')
-    user_id = data.get('user_id')
+    """Handle typing indicator, broadcast only when the state changes"""
+    room = chat_room(data)
+    if not room:
+        return
     is_typing = data.get('is_typing', False)
-    
-    room = f'chat_{campaign_id}_{proposal_id}'
-    emit('user_typing', {
-        'user_id': user_id,
-        'is_typing': is_typing
-    }, room=room, include_self=False)
+    typing_coalescer.update(room, session['identity']['user_id'], is_typing, request.sid)
 
 @socketio.on('mark_read')
 def handle_mark_read(data):
-    """Mark messages as read"""
+    """
+    Mark messages as read, either a list of message_ids or every message of
+    the proposal up to the up_to_id watermark
+    """
+    room = chat_room(data)
+    if not room:
+        emit('error', {'message': 'Join the chat first'})
+        return
+    
     try:
         message_ids = data.get('message_ids', [])
-        user_id = data.get('user_id')
-        
-        from models import ChatMessage
+        up_to_id = data.get('up_to_id')
+        user_id = session['identity']['user_id']
+        proposal_id = data.get('proposal_id')
         
-        # Mark messages as read
-        messages = ChatMessage.query.filter(
-            ChatMessage.id.in_(message_ids),
-            ChatMessage.recipient_id == user_id,
-            ChatMessage.read == False
-        ).all()
+        # Write queued messages first so they can be marked too
+        chat_writer.flush()
         
-        for message in messages:
-            message.read = True
-        
-        db.session.commit()
+        # Single UPDATE ... RETURNING, no rows loaded into the session
+        read_ids = mark_messages_read(user_id, proposal_id, message_ids=message_ids, up_to_id=up_to_id)
         
         # Notify sender about read receipts
-        if messages:
-            campaign_id = data.get('campaign_id')
-            proposal_id = data.get('proposal_id')
-            room = f'chat_{campaign_id}_{proposal_id}'
+        if read_ids:
             emit('messages_read', {
-                'message_ids': message_ids,
+                'message_ids': read_ids,
                 'read_by': user_id
             }, room=room)
         
@@ -183,52 +270,42 @@ def handle_mark_read(data):
 @socketio.on('send_message')
 def handle_send_message(data):
     """Handle incoming chat messages"""
-    campaign_id = data.get('campaign_id')
+    room = chat_room(data)
+    if not room:
+        emit('error', {'message': 'Join the chat first'})
+        return
+    
     proposal_id = data.get('proposal_id')
     message = data.get('message')
-    sender_id = data.get('sender_id')
+    sender_id = session['identity']['user_id']
+    activity_tracker.touch(sender_id)
     file_url = data.get('file_url')
     file_name = data.get('file_name')
     file_type = data.get('file_type')
     file_size = data.get('file_size')
     
-    room = f'chat_{campaign_id}_{proposal_id}'
-    
     # Save message to database
     try:
-        from models import ChatMessage, Proposal, Influencer, Brand, User
+        # Route params arrive as strings from the client
+        proposal_id = int(proposal_id)
         
-        # Get the proposal
-        proposal = Proposal.query.filter_by(id=proposal_id, campaign_id=campaign_id).first()
-        if not proposal:
+        # Get the proposal's influencer and brand users (cached, usually no query)
+        participants = proposal_participants(proposal_id)
+        if not participants:
             emit('error', {'message': 'Proposal not found'})
             return
         
-        # Get sender user
-        sender = User.query.get(sender_id)
-        if not sender:
-            emit('error', {'message': 'Sender not found'})
-            return
-        
-        # Determine if sender is influencer or brand
-        influencer = Influencer.query.filter_by(user_id=sender_id).first()
-        brand = Brand.query.filter_by(user_id=sender_id).first()
-        
-        if not influencer and not brand:
-            emit('error', {'message': 'User not found'})
-            return
-        
         # Determine recipient based on sender role
         # If sender is influencer, recipient is the brand
         # If sender is brand, recipient is the influencer
-        if influencer:
-            recipient_id = proposal.campaign.brand.user_id
+        if sender_id == participants.influencer_user_id:
+            recipient_id = participants.brand_user_id
         else:
-            recipient_id = proposal.influencer.user_id
+            recipient_id = participants.influencer_user_id
         
-        # Create and save message
+        # Create and save message (queued when write-behind is enabled)
         ist = pytz.timezone('Asia/Kolkata')
-        new_message = ChatMessage(
+        message_id, timestamp = chat_writer.save(
             proposal_id=proposal_id,
             sender_id=sender_id,
             recipient_id=recipient_id,
@@ -239,23 +316,22 @@ def handle_send_message(data):
             file_type=file_type,
             file_size=file_size
         )
-        db.session.add(new_message)
-        db.session.commit()
         
-        print(f'✅ Message saved: ID={new_message.id}, From={sender_id}, To={recipient_id}, Proposal={proposal_id}')
+        print(f'✅ Message saved: ID={message_id}, From={sender_id}, To={recipient_id}, Proposal={proposal_id}')
         
         # Broadcast to room
         message_data = {
-            'id': new_message.id,
+            'id': message_id,
             'sender_id': sender_id,
             'recipient_id': recipient_id,
             'message': message,
-            'timestamp': new_message.timestamp.isoformat(),
+            'timestamp': timestamp.isoformat(),
             'read': False,
             'file_url': file_url,
             'file_name': file_name,
             'file_type': file_type,
-            'file_size': file_size
+            'file_size': file_size,
+            'thumbnail_url': thumbnail_url(file_url, PREVIEW_SIZE)
         }
         emit('new_message', message_data, room=room)
         
@@ -0,0 +1,227 @@
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import case, func, insert
+
+# Import models
+from models import db, Brand, Campaign, Influencer, MatchRecommendation, Proposal
+
+CAMPAIGNS_FOR_INFLUENCER = 'campaigns_for_influencer'
+INFLUENCERS_FOR_CAMPAIGN = 'influencers_for_campaign'
+
+TOP_K = 20
+
+# Relative weight of each signal in the final score (they sum to 1)
+WEIGHTS = {
+    'niche': 0.4,       # influencer niche == brand industry
+    'reach': 0.25,      # follower count against what the budget can buy
+    'acceptance': 0.2,  # share of the influencer's proposals that were accepted
+    'bid': 0.15,        # influencer's average bid against the budget
+}
+
+# Followers a campaign can reasonably reach per unit of budget
+FOLLOWERS_PER_BUDGET_UNIT = 10
+
+# Influencer rows scored per pass when refreshing everything, bounding the
+# size of the influencer x campaign score matrix
+SCORE_CHUNK_SIZE = 512
+
+INSERT_BATCH_SIZE = 5000
+
+# A subject without a stored list (e.g. a profile created since the last
+# refresh) queues an early refresh, at most once per this many seconds
+REFRESH_REQUEST_INTERVAL = 300
+
+_refresh_lock = threading.Lock()
+_refresh_requested_at = None
+
+
+class MatchData:
+    """Column arrays for every influencer and campaign, ready for vectorized scoring."""
+
+    def __init__(self, influencer_rows, campaign_rows, proposal_stats):
+        # Niche and industry share one vocabulary so they compare as ints.
+        # Missing values get codes that never match anything.
+        vocabulary = {}
+
+        def code(value, missing):
+            if not value:
+                return missing
+            return vocabulary.setdefault(value.strip().lower(), len(vocabulary))
+
+        self.influencer_ids = np.array([row.id for row in influencer_rows], dtype=np.int64)
+        self.influencer_niche = np.array([code(row.niche, -1) for row in influencer_rows], dtype=np.int64)
+        self.followers = np.array([row.followers or 0 for row in influencer_rows], dtype=np.float64)
+
+        self.campaign_ids = np.array([row.id for row in campaign_rows], dtype=np.int64)
+        self.campaign_industry = np.array([code(row.industry, -2) for row in campaign_rows], dtype=np.int64)
+        self.budget = np.array([row.budget or 0 for row in campaign_rows], dtype=np.float64)
+        self.private = np.array([bool(row.private) for row in campaign_rows], dtype=bool)
+
+        # Laplace-smoothed acceptance rate (0.5 with no history) and average
+        # bid (NaN with no bids) per influencer
+        total = np.zeros(len(self.influencer_ids))
+        accepted = np.zeros(len(self.influencer_ids))
+        self.average_bid = np.full(len(self.influencer_ids), np.nan)
+        position = {influencer_id: i for i, influencer_id in enumerate(self.influencer_ids.tolist())}
+        for row in proposal_stats:
+            i = position.get(row.influencer_id)
+            if i is None:
+                continue
+            total[i] = row.total
+            accepted[i] = row.accepted or 0
+            if row.average_bid is not None:
+                self.average_bid[i] = row.average_bid
+        self.acceptance = (accepted + 1) / (total + 2)
+
+        self._log_followers = np.log10(self.followers + 1)
+        self._log_ideal_followers = np.log10(self.budget * FOLLOWERS_PER_BUDGET_UNIT + 1)
+
+    def score(self, influencers=slice(None), campaigns=slice(None)):
+        """Score matrix of shape (selected influencers, selected campaigns), values in [0, 1]."""
+        niche = (self.influencer_niche[influencers, None] == self.campaign_industry[None, campaigns])
+
+        reach = 1 / (1 + np.abs(
+            self._log_followers[influencers, None] - self._log_ideal_followers[None, campaigns]
+        ))
+
+        average_bid = self.average_bid[influencers, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bid = np.clip(self.budget[None, campaigns] / average_bid, 0, 1)
+        bid = np.where(np.isnan(average_bid), 0.5, bid)
+
+        return (WEIGHTS['niche'] * niche
+                + WEIGHTS['reach'] * reach
+                + WEIGHTS['acceptance'] * self.acceptance[influencers, None]
+                + WEIGHTS['bid'] * bid)
+
+
+def load_match_data():
+    """Load the scoring columns of Influencer, Campaign and Proposal in three queries."""
+    influencer_rows = db.session.query(
+        Influencer.id, Influencer.niche, Influencer.followers
+    ).all()
+    campaign_rows = db.session.query(
+        Campaign.id, Brand.industry, Campaign.budget, Campaign.private
+    ).join(Brand).all()
+    proposal_stats = db.session.query(
+        Proposal.influencer_id,
+        func.count(Proposal.id).label('total'),
+        func.sum(case((Proposal.status == 'accepted', 1), else_=0)).label('accepted'),
+        func.avg(Proposal.bid_amount).label('average_bid'),
+    ).group_by(Proposal.influencer_id).all()
+    return MatchData(influencer_rows, campaign_rows, proposal_stats)
+
+
+def _top_k(scores, k):
+    """Column indexes of the k best scores in each row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _campaign_scores_for_influencers(data, influencers):
+    scores = data.score(influencers=influencers)
+    # Influencers only ever see public campaigns
+    scores[:, data.private] = -np.inf
+    return scores
+
+
+def refresh_recommendations(k=TOP_K):
+    """Recompute and store the top-k lists in both directions. Returns the rows written."""
+    data = load_match_data()
+    computed_at = datetime.utcnow()
+    rows = []
+
+    # Campaigns for each influencer, SCORE_CHUNK_SIZE influencers per pass
+    for start in range(0, len(data.influencer_ids), SCORE_CHUNK_SIZE):
+        chunk = slice(start, start + SCORE_CHUNK_SIZE)
+        scores = _campaign_scores_for_influencers(data, chunk)
+        best = _top_k(scores, k)
+        for offset, columns in enumerate(best):
+            for rank, j in enumerate(columns):
+                if np.isfinite(scores[offset, j]):
+                    rows.append({
+                        'kind': CAMPAIGNS_FOR_INFLUENCER,
+                        'subject_id': int(data.influencer_ids[start + offset]),
+                        'candidate_id': int(data.campaign_ids[j]),
+                        'score': float(scores[offset, j]),
+                        'rank': rank,
+                        'computed_at': computed_at,
+                    })
+
+    # Influencers for each campaign, scoring the transposed matrix
+    for start in range(0, len(data.campaign_ids), SCORE_CHUNK_SIZE):
+        chunk = slice(start, start + SCORE_CHUNK_SIZE)
+        scores = data.score(campaigns=chunk).T
+        best = _top_k(scores, k)
+        for offset, columns in enumerate(best):
+            for rank, i in enumerate(columns):
+                rows.append({
+                    'kind': INFLUENCERS_FOR_CAMPAIGN,
+                    'subject_id': int(data.campaign_ids[start + offset]),
+                    'candidate_id': int(data.influencer_ids[i]),
+                    'score': float(scores[offset, i]),
+                    'rank': rank,
+                    'computed_at': computed_at,
+                })
+
+    # Swap the lists in one transaction so readers never see a partial refresh
+    MatchRecommendation.query.delete()
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(insert(MatchRecommendation), rows[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+    return len(rows)
+
+
+def _stored(kind, subject_id, k):
+    return [
+        (row.candidate_id, row.score)
+        for row in MatchRecommendation.query
+            .filter_by(kind=kind, subject_id=subject_id)
+            .order_by(MatchRecommendation.rank)
+            .limit(k)
+    ]
+
+
+def request_refresh():
+    """Queue refresh_match_recommendations, unless this process did so recently."""
+    global _refresh_requested_at
+    now = time.monotonic()
+    with _refresh_lock:
+        if _refresh_requested_at is not None and now - _refresh_requested_at < REFRESH_REQUEST_INTERVAL:
+            return False
+        _refresh_requested_at = now
+
+    from tasks import refresh_match_recommendations
+    try:
+        refresh_match_recommendations.delay()
+    except Exception as e:
+        print(f"Could not queue a match recommendation refresh: {e}")
+        return False
+    return True
+
+
+def recommended_campaigns(influencer_id, k=TOP_K):
+    """
+    Top campaigns for an influencer, from the precomputed lists. Scoring
+    needs every campaign and influencer, so it never runs in the request:
+    without a stored list the result is empty and a refresh is queued.
+    """
+    stored = _stored(CAMPAIGNS_FOR_INFLUENCER, influencer_id, k)
+    if not stored:
+        request_refresh()
+    return stored
+
+
+def recommended_influencers(campaign_id, k=TOP_K):
+    """Top influencers for a campaign, from the precomputed lists (see recommended_campaigns)."""
+    stored = _stored(INFLUENCERS_FOR_CAMPAIGN, campaign_id, k)
+    if not stored:
+        request_refresh()
+    return stored
@@ -0,0 +1,237 @@
+import re
+import sys
+
+from sqlalchemy import create_engine, inspect, select, text
+
+# Import models
+from models import db, Brand, Campaign, ChatMessage, Influencer, PasswordResetToken, Proposal, UnreadCounter
+from chat import rebuild_unread_counters
+from search import ensure_search_index
+
+
+def add_missing_columns(engine):
+    """
+    Add nullable columns declared on the models that existing tables lack.
+    db.create_all() never alters a table that already exists.
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.append(f'{table.name}.{column.name}')
+                print(f"Added column {column.name} to {table.name}")
+    return added
+
+
+def unread_counters_need_rebuild(engine):
+    """
+    True if unread_counter is missing, or was created before its foreign
+    keys cascaded on delete. The counters are derived from ChatMessage, so
+    the old table is simply dropped, recreated and refilled.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(UnreadCounter.__tablename__):
+        return True
+    foreign_keys = inspector.get_foreign_keys(UnreadCounter.__tablename__)
+    if all((fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE' for fk in foreign_keys):
+        return False
+    UnreadCounter.__table__.drop(engine)
+    print(f"Dropped {UnreadCounter.__tablename__} to recreate it with ON DELETE CASCADE")
+    return True
+
+
+def apply_indexes():
+    """
+    Build every index declared on the models that the live database is missing.
+
+    db.create_all() only creates indexes together with brand new tables, so
+    existing SQLite or Postgres databases need this step after an upgrade.
+    Missing nullable columns are added first, since new indexes may use them.
+    """
+    from main import app  # Import your Flask app instance
+    with app.app_context():
+        engine = db.engine
+        rebuild_counters = unread_counters_need_rebuild(engine)
+        db.create_all()
+        add_missing_columns(engine)
+
+        inspector = inspect(engine)
+        is_postgres = engine.dialect.name == 'postgresql'
+
+        created = []
+        for table in db.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda ix: ix.name):
+                if index.name in existing:
+                    continue
+
+                if is_postgres:
+                    # Build without taking a write lock on busy production tables.
+                    # CONCURRENTLY cannot run inside a transaction block.
+                    index.dialect_kwargs['postgresql_concurrently'] = True
+                    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                        index.create(bind=conn)
+                else:
+                    index.create(bind=engine)
+
+                created.append(index.name)
+                print(f"Created index {index.name} on {table.name}")
+
+        # Campaign full-text index (FTS5 table on SQLite, GIN index on Postgres)
+        with engine.begin() as conn:
+            ensure_search_index(conn)
+
+        # Write-behind used to take chat ids from IdBlock on Postgres too,
+        # leaving the id sequence behind the rows it wrote
+        if is_postgres:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('chat_message', 'id'), "
+                    "GREATEST(MAX(id), nextval(pg_get_serial_sequence('chat_message', 'id')))) "
+                    "FROM chat_message"
+                ))
+
+        # Unread counters start out empty, fill them from the existing messages
+        if rebuild_counters:
+            print(f"Backfilled {rebuild_unread_counters()} unread counters")
+
+        # Refresh planner statistics so the new indexes are actually picked up
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+
+        if not created:
+            print("All indexes already exist.")
+        return created
+
+
+def _endpoint_queries():
+    """Representative statements issued by the hot endpoints, keyed by endpoint."""
+    return [
+        ('ChatMessageResource.get', select(ChatMessage)
+            .where(ChatMessage.proposal_id == 1)
+            .order_by(ChatMessage.timestamp)),
+        ('ChatSyncResource.get (read receipts)', select(ChatMessage.id, ChatMessage.read_at)
+            .where(ChatMessage.proposal_id == 1, ChatMessage.read_at > '2024-01-01')
+            .order_by(ChatMessage.read_at, ChatMessage.id)),
+        ('ProposalsResource.get (influencer)', select(Proposal)
+            .where(Proposal.influencer_id == 1)),
+        ('ProposalsResource.get (brand)', select(Proposal)
+            .join(Campaign)
+            .where(Campaign.brand_id == 1)),
+        ('CampaignProposalsResource.get', select(Proposal)
+            .where(Proposal.campaign_id == 1)),
+        ('InfluencerCampaignResource.get', select(Campaign)
+            .join(Brand)
+            .where(Brand.industry == 'Technology')),
+        ('Influencer lookup by user', select(Influencer)
+            .where(Influencer.user_id == 1)),
+        ('Brand lookup by user', select(Brand)
+            .where(Brand.user_id == 1)),
+        ('VerifyResetTokenResource.get', select(PasswordResetToken)
+            .where(PasswordResetToken.token_hash == 'hash')),
+        ('UnreadCountsResource.get', select(UnreadCounter)
+            .where(UnreadCounter.recipient_id == 1, UnreadCounter.count > 0)),
+        ('InfluencerDiscoveryResource.get (niche)', select(Influencer)
+            .where(Influencer.niche == 'Technology', Influencer.followers >= 1000)
+            .order_by(Influencer.followers.desc(), Influencer.id.desc())),
+        ('InfluencerDiscoveryResource.get (all niches)', select(Influencer)
+            .where(Influencer.followers.between(1000, 50000))
+            .order_by(Influencer.followers.desc(), Influencer.id.desc())),
+    ]
+
+
+def _sqlite_table_scans(conn, sql):
+    # With sqlite_stat1 filled in by ANALYZE, SQLite rightly scans tiny dev
+    # tables. Plan against a stats-free copy of the live schema instead, so the
+    # result only depends on which indexes exist.
+    # Plain tables and indexes only: full-text virtual tables create their own
+    # shadow tables, and triggers don't affect plans.
+    rows = conn.execute(text(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE type IN ('table', 'index') AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+    )).all()
+    virtual = [row.name for row in rows if row.sql.upper().startswith('CREATE VIRTUAL TABLE')]
+    schema = [
+        row.sql for row in rows
+        if not any(row.name == name or row.name.startswith(f'{name}_') for name in virtual)
+    ]
+    scratch = create_engine('sqlite://')
+
+    # "SCAN campaign" is a full table scan, "SCAN campaign USING INDEX ..." and
+    # "SEARCH ..." are index driven.
+    scans = []
+    with scratch.connect() as scratch_conn:
+        for statement in schema:
+            scratch_conn.exec_driver_sql(statement)
+        plan = scratch_conn.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    scratch.dispose()
+
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r'SCAN (\w+)', detail)
+        if match and 'USING' not in detail:
+            scans.append(match.group(1))
+    return scans
+
+
+def _postgres_table_scans(conn, sql):
+    # Postgres happily seq-scans small tables, so forbid it for the check:
+    # a Seq Scan that survives this can only mean a missing index.
+    conn.execute(text('SET LOCAL enable_seqscan = off'))
+    plan = conn.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+
+    scans = []
+    pending = [plan[0]['Plan']]
+    while pending:
+        node = pending.pop()
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append(node.get('Relation Name'))
+        pending.extend(node.get('Plans', []))
+    return scans
+
+
+def check_query_plans():
+    """
+    Explain the hot endpoint queries and fail if any of them falls back to a
+    full table scan. Returns True when every plan is index driven.
+    """
+    from main import app  # Import your Flask app instance
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'postgresql':
+            find_scans = _postgres_table_scans
+        elif engine.dialect.name == 'sqlite':
+            find_scans = _sqlite_table_scans
+        else:
+            raise RuntimeError(f"Query plan check is not supported on {engine.dialect.name}")
+
+        ok = True
+        for label, stmt in _endpoint_queries():
+            sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+            with engine.begin() as conn:
+                scans = find_scans(conn, sql)
+            if scans:
+                ok = False
+                print(f"❌ {label}: full table scan on {', '.join(scans)}")
+            else:
+                print(f"✅ {label}")
+        return ok
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'apply'
+    if command == 'apply':
+        apply_indexes()
+    elif command == 'check':
+        sys.exit(0 if check_query_plans() else 1)
+    else:
+        print("Usage: python migrations.py [apply|check]")
+        sys.exit(2)
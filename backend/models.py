@@ -2,6 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_security import UserMixin,RoleMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import hashlib
 import pytz
 
 db=SQLAlchemy()
@@ -37,7 +38,7 @@ class User(db.Model, UserMixin):
     roles = db.relationship('Role', secondary=roles_users,
                             backref=db.backref('users', lazy='dynamic'))  
     fs_uniquifier = db.Column(db.String(255), unique=True, nullable=False)
-    last_activity = db.Column(db.DateTime, default=datetime.utcnow)
+    last_activity = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     auth_token = db.Column(db.String(255), unique=True, nullable=True)
     
     
@@ -46,9 +47,35 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return '<User %r>' % self.username
 
+class PasswordResetToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    user = db.relationship('User',
+                           backref=db.backref('reset_tokens', cascade='all, delete-orphan'))
+    # Only a SHA-256 of the emailed token is stored, so a leaked table can't be replayed
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def is_expired(self):
+        return datetime.utcnow() > self.expires_at
+
+    def __repr__(self):
+        return f'<PasswordResetToken user={self.user_id}>'
+
 class Influencer(db.Model):
+    # Discovery filters on niche and follower range and pages by (followers, id)
+    __table_args__ = (
+        db.Index('ix_influencer_niche_followers', 'niche', 'followers', 'id'),
+        db.Index('ix_influencer_followers', 'followers', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     user = db.relationship('User',  
  backref=db.backref('influencer', uselist=False))
     bio = db.Column(db.Text)
@@ -67,7 +94,7 @@ class Influencer(db.Model):
 
 class Brand(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     user = db.relationship('User',
                            backref=db.backref('brand', uselist=False))
     name = db.Column(db.String(120), nullable=False)
@@ -75,7 +102,7 @@ class Brand(db.Model):
     contact_email = db.Column(db.String(120))
     profile_image = db.Column(db.String(200))
     company_description = db.Column(db.Text)
-    industry = db.Column(db.String(100))
+    industry = db.Column(db.String(100), index=True)
     
     
     verified = db.Column(db.Boolean, default=False)
@@ -87,7 +114,7 @@ class Brand(db.Model):
 
 class Campaign(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    brand_id = db.Column(db.Integer, db.ForeignKey('brand.id'), nullable=False)
+    brand_id = db.Column(db.Integer, db.ForeignKey('brand.id'), nullable=False, index=True)
     brand = db.relationship('Brand',  
                             backref='campaigns')
     title = db.Column(db.String(200), nullable=False)
@@ -108,16 +135,17 @@ class Campaign(db.Model):
 
 class Proposal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)  
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False, index=True)
 
 
-    influencer_id = db.Column(db.Integer, db.ForeignKey('influencer.id'), nullable=False)
+    influencer_id = db.Column(db.Integer, db.ForeignKey('influencer.id'), nullable=False, index=True)
     influencer = db.relationship('Influencer', backref='proposals')
     status = db.Column(db.String(50))
     proposal_details = db.Column(db.Text)
     bid_amount = db.Column(db.Float)
     proposed_by = db.Column(db.String(50))
     chat_messages = db.relationship('ChatMessage', backref='proposal', cascade="all, delete-orphan")
+    unread_counters = db.relationship('UnreadCounter', cascade="all, delete-orphan")
     # ... other fields you want to add
 
 
@@ -131,6 +159,13 @@ class Niche(db.Model):
 
 
 class ChatMessage(db.Model):
+    # Chat history is always read per proposal in timestamp order, and
+    # delta sync reads the proposal's recent read receipts
+    __table_args__ = (
+        db.Index('ix_chat_message_proposal_id_timestamp', 'proposal_id', 'timestamp'),
+        db.Index('ix_chat_message_proposal_id_read_at', 'proposal_id', 'read_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  
 
@@ -144,6 +179,7 @@ class ChatMessage(db.Model):
     message = db.Column(db.Text, nullable=True)  # Made nullable for file-only messages
     timestamp = db.Column(db.DateTime, default=get_ist_time)
     read = db.Column(db.Boolean, default=False)  # Read receipt tracking
+    read_at = db.Column(db.DateTime, nullable=True)  # When read was set, for delta sync
     file_url = db.Column(db.String(500), nullable=True)  # File attachment URL
     file_name = db.Column(db.String(255), nullable=True)  # Original file name
     file_type = db.Column(db.String(50), nullable=True)  # File type (image, document, etc.)
@@ -152,3 +188,87 @@ class ChatMessage(db.Model):
     def __repr__(self):
         return f'<ChatMessage {self.id}>'
 
+
+
+class IdBlock(db.Model):
+    """
+    Hi/lo id allocator: next_id is the first id no process has reserved yet.
+    Used by the chat write-behind queue to hand out message ids before the
+    rows are inserted.
+    """
+    name = db.Column(db.String(50), primary_key=True)  # table the ids are for
+    next_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<IdBlock {self.name} next={self.next_id}>'
+
+
+
+class StoredFile(db.Model):
+    """
+    A deduplicated upload in the content-addressed store (see uploads.py).
+    ref_count is the number of rows whose profile_image or file_url points
+    at it; files at zero are removed by the purge_unreferenced_files task.
+    """
+    path = db.Column(db.String(200), primary_key=True)  # blobs/ab/cd/<sha256>.<ext>, under UPLOAD_FOLDER
+    digest = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the content
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    last_stored_at = db.Column(db.DateTime, default=datetime.utcnow)  # last time someone uploaded it
+    derivatives_at = db.Column(db.DateTime)  # when images.py made its thumbnails, None until then
+
+    def __repr__(self):
+        return f'<StoredFile {self.path} refs={self.ref_count}>'
+
+
+
+class ChunkedUpload(db.Model):
+    """A resumable chat attachment upload in progress (see uploads.py)."""
+    id = db.Column(db.String(64), primary_key=True)  # random, also names the temp file
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    file_name = db.Column(db.String(255), nullable=False)  # Original file name
+    file_size = db.Column(db.Integer, nullable=False)  # Declared total size in bytes
+    received = db.Column(db.Integer, nullable=False, default=0)  # Bytes written so far
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def is_expired(self):
+        return datetime.utcnow() > self.expires_at
+
+    def __repr__(self):
+        return f'<ChunkedUpload {self.id} {self.received}/{self.file_size}>'
+
+
+
+class UnreadCounter(db.Model):
+    """
+    Unread chat messages per recipient and proposal, kept in step with
+    ChatMessage.read by chat.increment_unread / chat.mark_messages_read.
+    The (recipient_id, proposal_id) primary key serves the per-user read.
+    """
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    proposal_id = db.Column(db.Integer, db.ForeignKey('proposal.id', ondelete='CASCADE'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UnreadCounter user={self.recipient_id} proposal={self.proposal_id} count={self.count}>'
+
+
+
+class MatchRecommendation(db.Model):
+    """Precomputed top-K matches, refreshed by the refresh_match_recommendations task."""
+    __table_args__ = (
+        db.Index('ix_match_recommendation_kind_subject_rank', 'kind', 'subject_id', 'rank'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 'campaigns_for_influencer' or 'influencers_for_campaign'
+    kind = db.Column(db.String(40), nullable=False)
+    subject_id = db.Column(db.Integer, nullable=False)
+    candidate_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MatchRecommendation {self.kind} {self.subject_id}->{self.candidate_id}>'
@@ -0,0 +1,133 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = 'X-DB-Query-Count'
+QUERY_TIME_HEADER = 'X-DB-Query-Time'
+
+# Counters opened by count_queries(), independent of any request
+_active_counters = []
+
+
+class QueryStats:
+    """Number of SQL statements and total time spent in the database."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
+
+    def record(self, duration):
+        self.count += 1
+        self.duration += duration
+
+
+def current_query_stats():
+    """
+    Stats for the current request or Socket.IO event (each event gets its own
+    request context), falling back to the app context, e.g. in Celery tasks.
+    """
+    if has_request_context():
+        holder = request
+    elif has_app_context():
+        holder = g
+    else:
+        return None
+
+    stats = getattr(holder, 'query_stats', None)
+    if stats is None:
+        stats = QueryStats()
+        holder.query_stats = stats
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+
+    stats = current_query_stats()
+    if stats is not None:
+        stats.record(duration)
+    for counter in _active_counters:
+        counter.record(duration)
+
+
+def _add_stats_headers(response):
+    stats = current_query_stats()
+    response.headers[QUERY_COUNT_HEADER] = str(stats.count)
+    response.headers[QUERY_TIME_HEADER] = f'{stats.duration_ms}ms'
+    return response
+
+
+def _log_stats(exc):
+    stats = current_query_stats()
+    if stats is None or not has_request_context():
+        return
+
+    # Flask-SocketIO runs every event inside a request context and records
+    # the event name on the request
+    socket_event = getattr(request, 'event', None)
+    if socket_event:
+        label = f"socket event '{socket_event['message']}'"
+    else:
+        label = f'{request.method} {request.path}'
+
+    threshold = current_app.config.get('QUERY_COUNT_WARNING_THRESHOLD', 20)
+    level = logging.WARNING if stats.count > threshold else logging.INFO
+    logger.log(level, '%s ran %d queries in %sms', label, stats.count, stats.duration_ms)
+
+
+def init_query_stats(app, db):
+    """Count queries and DB time per request / Socket.IO event on db's engine."""
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.after_request(_add_stats_headers)
+    app.teardown_request(_log_stats)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries issued inside the block, e.g.:
+
+        with count_queries() as stats:
+            create_resource_csv()
+        assert stats.count <= 2
+    """
+    stats = QueryStats()
+    _active_counters.append(stats)
+    try:
+        yield stats
+    finally:
+        _active_counters.remove(stats)
+
+
+def assert_query_budget(client, url, max_queries, method='get', **kwargs):
+    """
+    Test helper: issue a request through a Flask test client and fail if the
+    endpoint ran more than max_queries statements. Returns the response.
+
+        assert_query_budget(client, '/api/proposals', 4,
+                            headers={'Authentication-Token': token})
+    """
+    response = getattr(client, method)(url, **kwargs)
+    count = int(response.headers[QUERY_COUNT_HEADER])
+    if count > max_queries:
+        raise AssertionError(
+            f'{method.upper()} {url} ran {count} queries, budget is {max_queries}'
+        )
+    return response
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+
+from flask_socketio import SocketIO
+
+# Socket.IO message queue shared by every web worker and Celery process.
+#   redis://host:6379/0  Redis (or any Redis-protocol server), across hosts
+#   amqp://...           any other Kombu broker URL
+# Unset means rooms only exist inside the one process that owns them.
+# Flask-SocketIO's test client refuses to run with a queue, so tests leave
+# it unset and emit_to_room() goes through the local server instead.
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'flask-socketio')
+
+_emitter = None
+_local_server = None
+
+
+def socketio_queue_options():
+    """Keyword arguments that connect a SocketIO server to the message queue."""
+    if not SOCKETIO_MESSAGE_QUEUE:
+        return {}
+    return {'message_queue': SOCKETIO_MESSAGE_QUEUE, 'channel': SOCKETIO_CHANNEL}
+
+
+def external_emitter():
+    """
+    Write-only SocketIO for processes that serve no clients (Celery workers,
+    scripts). Its emits go through the message queue to whichever web worker
+    holds the room. None when no message queue is configured.
+    """
+    global _emitter
+    if _emitter is None and SOCKETIO_MESSAGE_QUEUE:
+        _emitter = SocketIO(**socketio_queue_options())
+    return _emitter
+
+
+def register_local_server(socketio):
+    """The SocketIO server of this process, used by emit_to_room() without a queue."""
+    global _local_server
+    _local_server = socketio
+
+
+def emit_to_room(event, data, room):
+    """
+    Emit to a Socket.IO room from outside an event handler (a task, a
+    script). Goes through the message queue when there is one; otherwise it
+    only reaches clients of this process's own server. Returns True if sent.
+    """
+    emitter = external_emitter() or _local_server
+    if emitter is None:
+        print(f'SOCKETIO_MESSAGE_QUEUE is not set, dropping {event} for {room}')
+        return False
+    emitter.emit(event, data, to=room)
+    return True
+
+
+# Typing indicators. Clients send 'typing' on every keystroke; rooms only
+# need to hear when someone starts or stops, plus a periodic refresh so the
+# client's 3 s auto-hide doesn't clear an indicator while typing goes on.
+TYPING_MIN_INTERVAL = 0.5   # seconds between two broadcasts for one user
+TYPING_REFRESH_INTERVAL = 2.0
+TYPING_TIMEOUT = 5.0        # no keystroke for this long means stopped
+TYPING_SWEEP_INTERVAL = 0.5
+
+
+class TypingCoalescer:
+    """
+    Collapses per-keystroke typing events into state-change broadcasts of
+    'user_typing', at most one per user per TYPING_MIN_INTERVAL. A user
+    whose client never sends is_typing=False is stopped after TYPING_TIMEOUT.
+    """
+
+    def __init__(self):
+        self.socketio = None
+        # (room, user_id) -> {'typing', 'emitted', 'last_emit', 'last_seen', 'sid'}
+        self._states = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def init_app(self, socketio):
+        self.socketio = socketio
+
+    def update(self, room, user_id, is_typing, sid):
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get((room, user_id))
+            if state is None:
+                state = self._states[(room, user_id)] = {
+                    'typing': False, 'emitted': False, 'last_emit': 0.0, 'last_seen': now, 'sid': sid,
+                }
+            state.update(typing=bool(is_typing), last_seen=now, sid=sid)
+            emit_now = self._due(state, now)
+            if not self._started:
+                self._started = True
+                self.socketio.start_background_task(self._sweep)
+        if emit_now is not None:
+            self._broadcast(room, user_id, emit_now, sid)
+
+    def _due(self, state, now):
+        """The is_typing value to broadcast now, or None. Call with the lock held."""
+        since_emit = now - state['last_emit']
+        changed = state['typing'] != state['emitted']
+        # Refresh only while keystrokes keep arriving
+        refresh = state['typing'] and state['last_seen'] > state['last_emit'] \
+            and since_emit >= TYPING_REFRESH_INTERVAL
+        if (changed and since_emit >= TYPING_MIN_INTERVAL) or refresh:
+            state.update(emitted=state['typing'], last_emit=now)
+            return state['typing']
+        return None
+
+    def _broadcast(self, room, user_id, is_typing, sid):
+        self.socketio.emit('user_typing', {
+            'user_id': user_id,
+            'is_typing': is_typing
+        }, to=room, skip_sid=sid)
+
+    def _sweep(self):
+        while True:
+            self.socketio.sleep(TYPING_SWEEP_INTERVAL)
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                for key, state in list(self._states.items()):
+                    if state['typing'] and now - state['last_seen'] >= TYPING_TIMEOUT:
+                        state['typing'] = False
+                    is_typing = self._due(state, now)
+                    if is_typing is not None:
+                        due.append((key, is_typing, state['sid']))
+                    elif not state['typing'] and not state['emitted']:
+                        del self._states[key]
+            for (room, user_id), is_typing, sid in due:
+                self._broadcast(room, user_id, is_typing, sid)
+
+
+typing_coalescer = TypingCoalescer()
@@ -14,11 +14,24 @@ from flask_socketio import emit
 #from main import api, socketio  # Import api from main.py
 import time
 import secrets
+import base64
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import contains_eager, joinedload
 #from flask_socketio import emit, join_room, leave_room
 from tasks import *
 from celery.result import AsyncResult
 from werkzeug.utils import safe_join
-from cache import cache
+from cache import cache, cached_response, etag_response
+from identity import current_identity
+from search import search_campaigns
+from matching import recommended_campaigns, recommended_influencers
+from chat import inbox_page, messages_since, unread_counts
+from chatwriter import chat_writer
+from uploads import (
+    AVATAR_SIZE, CHAT_MAX_FILE_SIZE, PREVIEW_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_CHUNK_SIZE,
+    allowed_chat_file, chat_attachment, discard_upload, file_sha256, start_upload, store_file,
+    store_stream, temp_path, thumbnail_url, write_chunk,
+)
 
 
 api = Api() 
@@ -63,11 +76,12 @@ class InfluencerRegistration(Resource):
                 return make_response(jsonify({'message': 'No profile image selected'}), 400)
 
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                from main import app  # Import app here to avoid circular imports
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                profile_image_path = filepath
+                # Stored once per distinct content, so equal file names never clash.
+                # allowed_file() checked this extension against the whitelist
+                extension = file.filename.rsplit('.', 1)[1].lower()
+                stored = store_stream(file.stream, extension)
+                queue_image_derivatives(stored)
+                profile_image_path = f'uploads/{stored.path}'
             else:
                 return make_response(jsonify({'message': 'Invalid image file type'}), 400)
 
@@ -134,11 +148,12 @@ class BrandRegistration(Resource):
                 return make_response(jsonify({'message': 'No profile image selected'}), 400)
 
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                from main import app  # Import your app instance here
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                profile_image_path = filepath
+                # Stored once per distinct content, so equal file names never clash.
+                # allowed_file() checked this extension against the whitelist
+                extension = file.filename.rsplit('.', 1)[1].lower()
+                stored = store_stream(file.stream, extension)
+                queue_image_derivatives(stored)
+                profile_image_path = f'uploads/{stored.path}'
             else:
                 return make_response(jsonify({'message': 'Invalid image file type'}), 400)
 
@@ -286,9 +301,10 @@ class AdminLogin(Resource):
 
 class CreateCampaign(Resource):
     @auth_required('token')
+    @etag_response('campaign', 'brand')
     def get(self):
         # Get the Brand associated with the current user
-        brand = Brand.query.filter_by(user_id=current_user.id).first()
+        brand = current_identity().brand
         
         if not brand:
             return make_response(jsonify({'message': 'Brand not found'}), 404) 
@@ -322,9 +338,8 @@ class CreateCampaign(Resource):
         Create a new campaign.
         """
         print(current_user)
-        user = current_user  
 
-        brand = Brand.query.filter_by(user_id=user.id).first()  
+        brand = current_identity().brand
         if not brand:
             return make_response(jsonify({'message': 'Brand not found'}), 404)
 
@@ -374,8 +389,7 @@ class CampaignResource(Resource):
         """
         Get a specific campaign by ID.
         """
-        user = current_user
-        brand = Brand.query.filter_by(user_id=user.id).first()
+        brand = current_identity().brand
         if not brand:
             return make_response(jsonify({'message': 'Brand not found'}), 404)
 
@@ -404,8 +418,7 @@ class CampaignResource(Resource):
         """
         Update a campaign.
         """
-        user = current_user
-        brand = Brand.query.filter_by(user_id=user.id).first()
+        brand = current_identity().brand
         if not brand:
             return make_response(jsonify({'message': 'Brand not found'}), 404)
 
@@ -444,8 +457,7 @@ class CampaignResource(Resource):
         """
         Delete a campaign.
         """
-        user = current_user
-        brand = Brand.query.filter_by(user_id=user.id).first()
+        brand = current_identity().brand
         if not brand:
             return make_response(jsonify({'message': 'Brand not found'}), 404)
 
@@ -474,14 +486,17 @@ proposal_fields = {
 class InfluencerCampaignResource(Resource):
     @roles_required('influencer') 
     @auth_required('token')
+    @etag_response('campaign', 'brand', 'influencer')
+    @cached_response('campaign', 'brand', 'influencer', per_user=True)
     def get(self):
         # Get the current influencer's niche
-        influencer = Influencer.query.filter_by(user_id=current_user.id).first()
+        influencer = current_identity().influencer
         if not influencer:
             return make_response(jsonify({'message': 'Influencer not found'}), 404)
         
-        # Query campaigns based on the influencer's niche
-        campaigns = Campaign.query.join(Brand).filter(Brand.industry == influencer.niche).all()
+        # Query campaigns based on the influencer's niche, loading the brand in the same join
+        campaigns = Campaign.query.join(Brand).filter(Brand.industry == influencer.niche) \
+            .options(contains_eager(Campaign.brand)).all()
 
         # Serialize the campaigns (convert to JSON format)
         result = []
@@ -504,8 +519,56 @@ class InfluencerCampaignResource(Resource):
 
         return make_response(jsonify(result), 200) 
 
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
 
+class CampaignSearchResource(Resource):
+    @auth_required('token')
+    @roles_required('influencer')
+    @cached_response('campaign', 'brand')
+    def get(self):
+        """
+        Full-text search over campaign title, description, goals and target
+        audience. ?q=<words>&page=<n>&per_page=<n>, best match first.
+        """
+        query = request.args.get('q', '').strip()
+        if not query:
+            return make_response(jsonify({'message': 'Search query is required'}), 400)
+
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+            per_page = int(request.args.get('per_page', SEARCH_PAGE_SIZE))
+        except ValueError:
+            return make_response(jsonify({'message': 'page and per_page must be integers'}), 400)
+        per_page = max(1, min(per_page, SEARCH_MAX_PAGE_SIZE))
+
+        # One extra row tells us whether there is a next page
+        results = search_campaigns(query, limit=per_page + 1, offset=(page - 1) * per_page)
+        has_more = len(results) > per_page
+
+        campaigns = []
+        for campaign, rank in results[:per_page]:
+            campaigns.append({
+                'id': campaign.id,
+                'brand_name': campaign.brand.name,
+                'title': campaign.title,
+                'description': campaign.description,
+                'start_date': campaign.start_date.isoformat() if campaign.start_date else None,
+                'end_date': campaign.end_date.isoformat() if campaign.end_date else None,
+                'budget': campaign.budget,
+                'status': campaign.status,
+                'campaign_goals': campaign.campaign_goals,
+                'target_audience': campaign.target_audience,
+                'rank': rank,
+            })
 
+        return make_response(jsonify({
+            'campaigns': campaigns,
+            'page': page,
+            'per_page': per_page,
+            'has_more': has_more
+        }), 200)
 
 
 
@@ -518,8 +581,7 @@ class ProposalResource(Resource):
         """
         Create a new proposal for a campaign (from influencer side).
         """
-        user = current_user
-        influencer = Influencer.query.filter_by(user_id=user.id).first()
+        influencer = current_identity().influencer
         if not influencer:
             return make_response(jsonify({'message': 'Influencer not found'}), 404)
 
@@ -559,8 +621,7 @@ class BrandProposalResource(Resource):
         """
         Create a new proposal for a campaign (from brand side).
         """
-        user = current_user
-        brand = Brand.query.filter_by(user_id=user.id).first()
+        brand = current_identity().brand
         if not brand:
             return jsonify({'message': 'Brand not found'}), 404
 
@@ -599,6 +660,7 @@ class BrandProposalResource(Resource):
 
 class UserDetails(Resource):
     @auth_required('token')
+    @etag_response('user', 'influencer', 'brand')
     def get(self):
         """
         Get user details (Influencer or Brand).
@@ -606,7 +668,7 @@ class UserDetails(Resource):
         user = current_user
 
         if user.type == 'influencer':
-            influencer = Influencer.query.filter_by(user_id=user.id).first()
+            influencer = current_identity().influencer
             if not influencer:
                 return make_response(jsonify({'message': 'Influencer details not found'}), 404)
 
@@ -619,11 +681,12 @@ class UserDetails(Resource):
                 'niche': influencer.niche,
                 'followers': influencer.followers,
                 'profile_image': influencer.profile_image,
+                'profile_thumbnail': thumbnail_url(influencer.profile_image, AVATAR_SIZE),
                 # ... add other influencer fields as needed
             }
 
         elif user.type == 'brand':
-            brand = Brand.query.filter_by(user_id=user.id).first()
+            brand = current_identity().brand
             if not brand:
                 return make_response(jsonify({'message': 'Brand details not found'}), 404)
 
@@ -636,6 +699,7 @@ class UserDetails(Resource):
                 'website': brand.website,
                 'contact_email': brand.contact_email,
                 'profile_image': brand.profile_image,
+                'profile_thumbnail': thumbnail_url(brand.profile_image, AVATAR_SIZE),
                 # ... add other brand fields as needed
             }
 
@@ -650,13 +714,11 @@ class ProposalResourceUpdate(Resource):
         """
         Update the status of a proposal (accept/reject/negotiate).
         """
-        user = current_user
         
         # Determine if the user is an influencer or a brand
-        influencer = Influencer.query.filter_by(user_id=user.id).first()
-        brand = Brand.query.filter_by(user_id=user.id).first()
+        identity = current_identity()
 
-        if not influencer and not brand:
+        if not identity.profile:
             return make_response(jsonify({'message': 'User not found'}), 404)
 
         proposal = Proposal.query.filter_by(id=proposal_id, campaign_id=campaign_id).first()
@@ -664,8 +726,7 @@ class ProposalResourceUpdate(Resource):
             return make_response(jsonify({'message': 'Proposal not found'}), 404)
 
         # Check if the user is authorized to update this proposal
-        if (influencer and proposal.influencer_id != influencer.id) and \
-           (brand and proposal.campaign.brand_id != brand.id):
+        if not identity.can_access_proposal(proposal):
             return make_response(jsonify({'message': 'Unauthorized'}), 403)
 
         data = request.get_json()
@@ -694,26 +755,32 @@ class ProposalResourceUpdate(Resource):
 
 class ProposalsResource(Resource):
     @auth_required('token')
+    @etag_response('proposal', 'campaign', 'influencer', 'brand', 'user')
     def get(self):
         user_type = current_user.type  # Get the user type ('influencer' or 'brand')
 
         if user_type == 'influencer':
             # Fetch proposals for the influencer
-            influencer = Influencer.query.filter_by(user_id=current_user.id).first()
+            influencer = current_identity().influencer
             if not influencer:
                 return make_response(jsonify({'message': 'Influencer not found'}), 404)
-            proposals = Proposal.query.filter_by(influencer_id=influencer.id).all()
+            proposals = Proposal.query.filter_by(influencer_id=influencer.id) \
+                .options(joinedload(Proposal.campaign),
+                         joinedload(Proposal.influencer).joinedload(Influencer.user)).all()
 
         elif user_type == 'brand':
             # Fetch proposals for the brand
-            brand = Brand.query.filter_by(user_id=current_user.id).first()
+            brand = current_identity().brand
             if not brand:
                 return make_response(jsonify({'message': 'Brand not found'}), 404)
-            proposals = Proposal.query.join(Campaign).filter(Campaign.brand_id == brand.id).all()
+            proposals = Proposal.query.join(Campaign).filter(Campaign.brand_id == brand.id) \
+                .options(contains_eager(Proposal.campaign),
+                         joinedload(Proposal.influencer).joinedload(Influencer.user)).all()
 
         else:
             return make_response(jsonify({'message': 'Invalid user type'}), 400)
 
+        # campaign and influencer.user were loaded above; the loop below issues no queries
         proposal_list = []
         for proposal in proposals:
             proposal_data = {
@@ -744,7 +811,8 @@ class CampaignProposalsResource(Resource):
             return make_response(jsonify({'message': 'Campaign not found'}), 404)
 
         # Get the proposals associated with the campaign
-        proposals = Proposal.query.filter_by(campaign_id=campaign_id).all()
+        proposals = Proposal.query.filter_by(campaign_id=campaign_id) \
+            .options(joinedload(Proposal.influencer).joinedload(Influencer.user)).all()
 
         proposal_list = []
         for proposal in proposals:
@@ -796,6 +864,47 @@ chat_message_fields = {
     # ... other fields ...
 }
 
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque cursor for a (timestamp, id) position."""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def encode_chat_cursor(message):
+    """Opaque cursor for a message's (timestamp, id) position in a chat."""
+    return encode_cursor(message.timestamp, message.id)
+
+
+def decode_chat_cursor(cursor):
+    """Inverse of encode_chat_cursor. Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, message_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except Exception:
+        raise ValueError(f'Invalid cursor: {cursor}')
+
+
+def chat_message_data(msg):
+    return {
+        'id': msg.id,
+        'sender_id': msg.sender_id,
+        'recipient_id': msg.recipient_id,
+        'message': msg.message,
+        'timestamp': msg.timestamp.isoformat(),
+        'read': msg.read if hasattr(msg, 'read') else False,
+        'file_url': msg.file_url if hasattr(msg, 'file_url') else None,
+        'file_name': msg.file_name if hasattr(msg, 'file_name') else None,
+        'file_type': msg.file_type if hasattr(msg, 'file_type') else None,
+        'file_size': msg.file_size if hasattr(msg, 'file_size') else None,
+        'thumbnail_url': thumbnail_url(msg.file_url, PREVIEW_SIZE)
+    }
+
+
 class ChatMessageResource(Resource):
     @auth_required('token')
     def post(self, campaign_id, proposal_id):
@@ -810,15 +919,13 @@ class ChatMessageResource(Resource):
             return make_response(jsonify({'message': 'Proposal not found'}), 404)
 
         # Determine if the user is an influencer or a brand
-        influencer = Influencer.query.filter_by(user_id=user.id).first()
-        brand = Brand.query.filter_by(user_id=user.id).first()
+        identity = current_identity()
 
-        if not influencer and not brand:
+        if not identity.profile:
             return make_response(jsonify({'message': 'User not found'}), 404) 
 
         # Check if the user is authorized to send a message for this proposal
-        if (influencer and proposal.influencer_id != influencer.id) and \
-           (brand and proposal.campaign.brand_id != brand.id):
+        if not identity.can_access_proposal(proposal):
             return make_response(jsonify({'message': 'Unauthorized'}), 403)
 
         data = request.get_json()
@@ -828,25 +935,23 @@ class ChatMessageResource(Resource):
             return make_response(jsonify({'message': 'Message body is required'}), 400)
 
         # Determine recipient based on sender role
-        recipient_id = proposal.campaign.brand.user_id if influencer else proposal.influencer.user_id
+        recipient_id = proposal.campaign.brand.user_id if identity.influencer else proposal.influencer.user_id
 
-        new_message = ChatMessage(
+        message_id, timestamp = chat_writer.save(
             sender_id=user.id,
             recipient_id=recipient_id,
             proposal_id=proposal_id,
             message=message
         )
-        db.session.add(new_message)
-        db.session.commit()
 
         # Use make_response with jsonify:
         return make_response(jsonify({
-            'id': new_message.id,
-            'sender_id': new_message.sender_id,
-            'recipient_id': new_message.recipient_id,
-            'proposal_id': new_message.proposal_id,
-            'message': new_message.message,
-            'timestamp': new_message.timestamp.isoformat()
+            'id': message_id,
+            'sender_id': user.id,
+            'recipient_id': recipient_id,
+            'proposal_id': proposal_id,
+            'message': message,
+            'timestamp': timestamp.isoformat()
         }), 201)
 
 
@@ -854,7 +959,15 @@ class ChatMessageResource(Resource):
     @auth_required('token')
     def get(self, campaign_id, proposal_id):
         """
-        Fetch all chat messages for a proposal (for WebSocket chat).
+        Fetch a page of chat messages for a proposal (for WebSocket chat).
+
+        Pages are keyed on (timestamp, id). Without a cursor the newest page is
+        returned; ?before=<cursor> walks back through older history and
+        ?after=<cursor> returns only messages newer than the cursor (e.g. after
+        a reconnect). ?limit caps the page size. Messages are always returned
+        oldest first; next_cursor continues in the same direction and is null
+        once there is nothing more to fetch. latest_cursor points at the newest
+        message of the page, ready to be passed back as ?after=.
         """
         print(f"📨 GET request for chat messages - Campaign: {campaign_id}, Proposal: {proposal_id}")
         
@@ -869,42 +982,76 @@ class ChatMessageResource(Resource):
                 return make_response(jsonify({'message': 'Proposal not found'}), 404)
 
             # Check authorization
-            influencer = Influencer.query.filter_by(user_id=user.id).first()
-            brand = Brand.query.filter_by(user_id=user.id).first()
+            identity = current_identity()
 
-            if not influencer and not brand:
+            if not identity.profile:
                 print("❌ User not found (neither influencer nor brand)")
                 return make_response(jsonify({'message': 'User not found'}), 404)
 
             # Verify user has access to this proposal's chat
-            if (influencer and proposal.influencer_id != influencer.id) and \
-               (brand and proposal.campaign.brand_id != brand.id):
+            if not identity.can_access_proposal(proposal):
                 print("❌ Unauthorized access to proposal")
                 return make_response(jsonify({'message': 'Unauthorized'}), 403)
 
-            # Fetch all messages for this proposal
-            messages = ChatMessage.query.filter_by(proposal_id=proposal_id).order_by(ChatMessage.timestamp).all()
-            
+            before = request.args.get('before')
+            after = request.args.get('after')
+            if before and after:
+                return make_response(jsonify({'message': 'Use either before or after, not both'}), 400)
+
+            try:
+                limit = int(request.args.get('limit', CHAT_PAGE_SIZE))
+                cursor = decode_chat_cursor(before or after) if (before or after) else None
+            except ValueError as e:
+                return make_response(jsonify({'message': str(e)}), 400)
+            limit = max(1, min(limit, CHAT_MAX_PAGE_SIZE))
+
+            # Messages still queued by this worker's write-behind must show up
+            chat_writer.flush()
+
+            # Keyset pagination over the (proposal_id, timestamp) index.
+            # One extra row tells us whether another page exists.
+            query = ChatMessage.query.filter_by(proposal_id=proposal_id)
+            if after:
+                cursor_ts, cursor_id = cursor
+                query = query.filter(or_(
+                    ChatMessage.timestamp > cursor_ts,
+                    and_(ChatMessage.timestamp == cursor_ts, ChatMessage.id > cursor_id)
+                )).order_by(ChatMessage.timestamp, ChatMessage.id)
+            else:
+                if before:
+                    cursor_ts, cursor_id = cursor
+                    query = query.filter(or_(
+                        ChatMessage.timestamp < cursor_ts,
+                        and_(ChatMessage.timestamp == cursor_ts, ChatMessage.id < cursor_id)
+                    ))
+                query = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+
+            messages = query.limit(limit + 1).all()
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+            if not after:
+                messages.reverse()
+
+            if has_more:
+                next_cursor = encode_chat_cursor(messages[-1] if after else messages[0])
+            else:
+                next_cursor = None
+            if messages:
+                latest_cursor = encode_chat_cursor(messages[-1])
+            else:
+                latest_cursor = after
+
             print(f"✅ Found {len(messages)} messages")
             
             # Format messages for response
-            messages_data = [
-                {
-                    'id': msg.id,
-                    'sender_id': msg.sender_id,
-                    'recipient_id': msg.recipient_id,
-                    'message': msg.message,
-                    'timestamp': msg.timestamp.isoformat(),
-                    'read': msg.read if hasattr(msg, 'read') else False,
-                    'file_url': msg.file_url if hasattr(msg, 'file_url') else None,
-                    'file_name': msg.file_name if hasattr(msg, 'file_name') else None,
-                    'file_type': msg.file_type if hasattr(msg, 'file_type') else None,
-                    'file_size': msg.file_size if hasattr(msg, 'file_size') else None
-                }
-                for msg in messages
-            ]
-
-            return make_response(jsonify({'messages': messages_data}), 200)
+            messages_data = [chat_message_data(msg) for msg in messages]
+
+            return make_response(jsonify({
+                'messages': messages_data,
+                'next_cursor': next_cursor,
+                'has_more': has_more,
+                'latest_cursor': latest_cursor
+            }), 200)
             
         except Exception as e:
             print(f"❌ Error fetching messages: {e}")
@@ -915,7 +1062,290 @@ class ChatMessageResource(Resource):
 
 
 
+class UnreadCountsResource(Resource):
+    @auth_required('token')
+    def get(self):
+        """Unread chat message counts of the current user, per proposal."""
+        counts = unread_counts(current_user.id)
+        return make_response(jsonify({
+            'total': sum(counts.values()),
+            'proposals': [
+                {'proposal_id': proposal_id, 'unread': count}
+                for proposal_id, count in sorted(counts.items())
+            ]
+        }), 200)
+
+
+
+# Hard cap on each list of a delta sync response
+CHAT_SYNC_MAX_ROWS = 500
+
+
+class ChatSyncResource(Resource):
+    @auth_required('token')
+    def get(self, campaign_id, proposal_id):
+        """
+        Delta sync after a reconnect: ?after_id=<last message id the client
+        has> returns only newer messages, plus read receipts set since
+        ?read_cursor (default: since the after_id message was sent). Pass
+        next_after_id and read_cursor back on the next call; has_more says
+        to call again straight away.
+        """
+        proposal = Proposal.query.filter_by(id=proposal_id, campaign_id=campaign_id).first()
+        if not proposal:
+            return make_response(jsonify({'message': 'Proposal not found'}), 404)
+        identity = current_identity()
+        if not identity.can_access_proposal(proposal):
+            return make_response(jsonify({'message': 'Unauthorized'}), 403)
+
+        try:
+            after_id = int(request.args['after_id'])
+            limit = max(1, min(int(request.args.get('limit', CHAT_SYNC_MAX_ROWS)), CHAT_SYNC_MAX_ROWS))
+            read_cursor = request.args.get('read_cursor')
+            read_after = decode_chat_cursor(read_cursor) if read_cursor else None
+        except (KeyError, ValueError):
+            return make_response(jsonify({'message': 'after_id is required; limit and read_cursor must be valid'}), 400)
+
+        # Messages still queued by this worker's write-behind must show up
+        chat_writer.flush()
+
+        anchor = db.session.execute(
+            db.select(ChatMessage.timestamp).filter_by(id=after_id, proposal_id=proposal_id)
+        ).scalar()
+        if anchor is None:
+            return make_response(jsonify({'message': 'Unknown after_id for this chat'}), 400)
+        # A message can't be read before it was sent
+        read_after = read_after or (anchor, 0)
+
+        messages, receipts, has_more = messages_since(proposal_id, (anchor, after_id), read_after, limit)
+
+        return make_response(jsonify({
+            'messages': [chat_message_data(msg) for msg in messages],
+            'read_receipts': [
+                {'id': receipt.id, 'read_at': receipt.read_at.isoformat()} for receipt in receipts
+            ],
+            'next_after_id': messages[-1].id if messages else after_id,
+            'read_cursor': encode_cursor(receipts[-1].read_at, receipts[-1].id) if receipts
+                else encode_cursor(*read_after),
+            'has_more': has_more,
+        }), 200)
+
+
+
+INBOX_PAGE_SIZE = 20
+INBOX_MAX_PAGE_SIZE = 100
+
+
+class InboxResource(Resource):
+    @auth_required('token')
+    def get(self):
+        """
+        Conversation list of the current user: the latest message of each
+        proposal with its unread count, most recent activity first.
+        ?limit caps the page size and ?cursor=<next_cursor> continues.
+        """
+        try:
+            limit = max(1, min(int(request.args.get('limit', INBOX_PAGE_SIZE)), INBOX_MAX_PAGE_SIZE))
+            cursor = request.args.get('cursor')
+            before = decode_chat_cursor(cursor) if cursor else None
+        except ValueError:
+            return make_response(jsonify({'message': 'Invalid limit or cursor'}), 400)
+
+        identity = current_identity()
+        rows, has_more = inbox_page(identity, limit, before)
+
+        conversations = []
+        for row in rows:
+            conversations.append({
+                'proposal_id': row.proposal_id,
+                'campaign_id': row.campaign_id,
+                'campaign_title': row.campaign_title,
+                'proposal_status': row.status,
+                # The other party of the conversation
+                'with_name': row.brand_name if identity.influencer else row.influencer_name,
+                'last_message': {
+                    'id': row.id,
+                    'sender_id': row.sender_id,
+                    'message': row.message,
+                    'file_name': row.file_name,
+                    'file_type': row.file_type,
+                    'timestamp': row.timestamp.isoformat(),
+                },
+                'last_activity': row.timestamp.isoformat(),
+                'unread': row.unread,
+            })
+
+        return make_response(jsonify({
+            'conversations': conversations,
+            'next_cursor': encode_chat_cursor(rows[-1]) if has_more else None,
+            'has_more': has_more,
+        }), 200)
+
+
+
+class RecommendedCampaignsResource(Resource):
+    @auth_required('token')
+    @roles_required('influencer')
+    def get(self):
+        """Campaigns that best fit the current influencer, best match first."""
+        influencer = current_identity().influencer
+        if not influencer:
+            return make_response(jsonify({'message': 'Influencer not found'}), 404)
+
+        scores = recommended_campaigns(influencer.id)
+        campaigns = Campaign.query.options(joinedload(Campaign.brand)) \
+            .filter(Campaign.id.in_([campaign_id for campaign_id, _ in scores])) \
+            .filter(Campaign.private.isnot(True)).all()
+        by_id = {campaign.id: campaign for campaign in campaigns}
+
+        result = []
+        for campaign_id, score in scores:
+            campaign = by_id.get(campaign_id)
+            if not campaign:
+                continue
+            result.append({
+                'id': campaign.id,
+                'brand_name': campaign.brand.name,
+                'title': campaign.title,
+                'description': campaign.description,
+                'start_date': campaign.start_date.isoformat() if campaign.start_date else None,
+                'end_date': campaign.end_date.isoformat() if campaign.end_date else None,
+                'budget': campaign.budget,
+                'status': campaign.status,
+                'score': round(score, 4),
+            })
+
+        return make_response(jsonify({'campaigns': result}), 200)
+
+
+class RecommendedInfluencersResource(Resource):
+    @auth_required('token')
+    @roles_required('brand')
+    def get(self, campaign_id):
+        """Influencers that best fit one of the current brand's campaigns."""
+        brand = current_identity().brand
+        if not brand:
+            return make_response(jsonify({'message': 'Brand not found'}), 404)
+
+        campaign = Campaign.query.filter_by(id=campaign_id, brand_id=brand.id).first()
+        if not campaign:
+            return make_response(jsonify({'message': 'Campaign not found'}), 404)
+
+        scores = recommended_influencers(campaign.id)
+        influencers = Influencer.query.options(joinedload(Influencer.user)) \
+            .filter(Influencer.id.in_([influencer_id for influencer_id, _ in scores])).all()
+        by_id = {influencer.id: influencer for influencer in influencers}
+
+        result = []
+        for influencer_id, score in scores:
+            influencer = by_id.get(influencer_id)
+            if not influencer:
+                continue
+            result.append({
+                'id': influencer.id,
+                'user_id': influencer.user_id,
+                'username': influencer.user.username,
+                'niche': influencer.niche,
+                'followers': influencer.followers,
+                'profile_image': influencer.profile_image,
+                'profile_thumbnail': thumbnail_url(influencer.profile_image, AVATAR_SIZE),
+                'score': round(score, 4),
+            })
+
+        return make_response(jsonify({'influencers': result}), 200)
+
+
+DISCOVERY_PAGE_SIZE = 20
+DISCOVERY_MAX_PAGE_SIZE = 100
+
+
+class InfluencerDiscoveryResource(Resource):
+    @auth_required('token')
+    @roles_required('brand')
+    def get(self):
+        """
+        Find influencers by niche and follower range, sorted by followers.
+
+        ?niche=<name>&min_followers=<n>&max_followers=<n>
+        &sort=followers_desc|followers_asc&limit=<n>&cursor=<next_cursor>
+
+        Pages are keyed on (followers, id) over the niche/followers indexes.
+        Influencers without a follower count are not listed.
+        """
+        niche = request.args.get('niche')
+        sort = request.args.get('sort', 'followers_desc')
+        if sort not in ('followers_desc', 'followers_asc'):
+            return make_response(jsonify({'message': 'sort must be followers_desc or followers_asc'}), 400)
+
+        try:
+            # int() rather than get(type=int), which would turn a bad value into None
+            min_followers = int(request.args['min_followers']) if 'min_followers' in request.args else None
+            max_followers = int(request.args['max_followers']) if 'max_followers' in request.args else None
+            limit = int(request.args.get('limit', DISCOVERY_PAGE_SIZE))
+            cursor = request.args.get('cursor')
+            if cursor:
+                raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+                cursor_followers, cursor_id = (int(value) for value in raw.split('|'))
+        except ValueError:
+            return make_response(jsonify({'message': 'Invalid filter or cursor'}), 400)
+        limit = max(1, min(limit, DISCOVERY_MAX_PAGE_SIZE))
+
+        query = Influencer.query.options(joinedload(Influencer.user)) \
+            .filter(Influencer.followers.isnot(None))
+        if niche:
+            query = query.filter(Influencer.niche == niche)
+        if min_followers is not None:
+            query = query.filter(Influencer.followers >= min_followers)
+        if max_followers is not None:
+            query = query.filter(Influencer.followers <= max_followers)
+
+        if sort == 'followers_desc':
+            if cursor:
+                query = query.filter(or_(
+                    Influencer.followers < cursor_followers,
+                    and_(Influencer.followers == cursor_followers, Influencer.id < cursor_id)
+                ))
+            query = query.order_by(Influencer.followers.desc(), Influencer.id.desc())
+        else:
+            if cursor:
+                query = query.filter(or_(
+                    Influencer.followers > cursor_followers,
+                    and_(Influencer.followers == cursor_followers, Influencer.id > cursor_id)
+                ))
+            query = query.order_by(Influencer.followers, Influencer.id)
+
+        influencers = query.limit(limit + 1).all()
+        has_more = len(influencers) > limit
+        influencers = influencers[:limit]
+
+        next_cursor = None
+        if has_more:
+            last = influencers[-1]
+            next_cursor = base64.urlsafe_b64encode(f'{last.followers}|{last.id}'.encode()).decode()
+
+        return make_response(jsonify({
+            'influencers': [
+                {
+                    'id': influencer.id,
+                    'user_id': influencer.user_id,
+                    'username': influencer.user.username,
+                    'bio': influencer.bio,
+                    'niche': influencer.niche,
+                    'followers': influencer.followers,
+                    'profile_image': influencer.profile_image,
+                    'profile_thumbnail': thumbnail_url(influencer.profile_image, AVATAR_SIZE),
+                }
+                for influencer in influencers
+            ],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }), 200)
+
+
+
+
 class NicheAPI(Resource):
+    @cached_response('niche')
     def get(self):
         """Get all niches."""
         try:
@@ -930,81 +1360,122 @@ class NicheAPI(Resource):
 
 
 
+STREAM_BATCH_SIZE = 500
+
+
+def wants_stream():
+    """True when the client asked for a streamed response with ?stream=1."""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_json_array(query, serialize):
+    """
+    Stream the rows of query as a JSON array. Rows are fetched from the
+    server in STREAM_BATCH_SIZE batches and written out one by one, so memory
+    stays flat and the first byte goes out before the last row is read.
+    """
+    def generate():
+        yield '['
+        for index, row in enumerate(query.yield_per(STREAM_BATCH_SIZE)):
+            if index:
+                yield ','
+            yield json.dumps(serialize(row))
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def brand_professional_data(brand):
+    return {
+        'id': brand.id,
+        'user_id': brand.user_id,
+        'name': brand.name,
+        'website': brand.website,
+        'contact_email': brand.contact_email,
+        'profile_image': brand.profile_image,
+        'profile_thumbnail': thumbnail_url(brand.profile_image, AVATAR_SIZE),
+        'company_description': brand.company_description,
+        'industry': brand.industry,
+        'verified': brand.verified,
+        'active': brand.user.active,  # Access user's active status directly
+        'user': {
+            'id': brand.user.id,
+            'username': brand.user.username,
+            'email': brand.user.email,
+            # Add other user attributes as needed
+        }
+    }
+
+
+def influencer_professional_data(influencer):
+    return {
+        'id': influencer.id,
+        'user_id': influencer.user_id,
+        'bio': influencer.bio,
+        'niche': influencer.niche,
+        'followers': influencer.followers,
+        'profile_image': influencer.profile_image,
+        'profile_thumbnail': thumbnail_url(influencer.profile_image, AVATAR_SIZE),
+        'active': influencer.user.active,  # Access user's active status directly
+        'user': {
+            'id': influencer.user.id,
+            'username': influencer.user.username,
+            'email': influencer.user.email,
+            # Add other user attributes as needed
+        }
+    }
+
+
+def admin_campaign_data(campaign):
+    return {
+        'id': campaign.id,
+        'title': campaign.title,
+        'brand_name': campaign.brand.name,
+        'description': campaign.description,
+        'start_date': campaign.start_date.strftime('%Y-%m-%d') if campaign.start_date else None,
+        'end_date': campaign.end_date.strftime('%Y-%m-%d') if campaign.end_date else None,
+        'budget': campaign.budget,
+        'status': campaign.status,
+        'campaign_goals': campaign.campaign_goals,
+        'target_audience': campaign.target_audience,
+        'private': campaign.private  # Add the 'private' attribute
+    }
+
+
 class BrandProfessionalsAPI(Resource):
     #@roles_required('admin')  # Requires admin role
+    @cached_response('brand', 'user')
     def get(self):
-        brands = Brand.query.all()
-        brand_list = []
-        for brand in brands:
-            brand_data = {
-                'id': brand.id,
-                'user_id': brand.user_id,
-                'name': brand.name,
-                'website': brand.website,
-                'contact_email': brand.contact_email,
-                'profile_image': brand.profile_image,
-                'company_description': brand.company_description,
-                'industry': brand.industry,
-                'verified': brand.verified,
-                'active': brand.user.active,  # Access user's active status directly
-                'user': {
-                    'id': brand.user.id,
-                    'username': brand.user.username,
-                    'email': brand.user.email,
-                    # Add other user attributes as needed
-                }
-            }
-            brand_list.append(brand_data)
+        query = Brand.query.options(joinedload(Brand.user))
+        if wants_stream():
+            return stream_json_array(query, brand_professional_data)
+
+        brand_list = [brand_professional_data(brand) for brand in query.all()]
         return jsonify(brand_list)
 
 class InfluencerProfessionalsAPI(Resource):
     #@roles_required('admin')  # Requires admin role
+    @cached_response('influencer', 'user')
     def get(self):
-        influencers = Influencer.query.all()
-        influencer_list = []
-        for influencer in influencers:
-            influencer_data = {
-                'id': influencer.id,
-                'user_id': influencer.user_id,
-                'bio': influencer.bio,
-                'niche': influencer.niche,
-                'followers': influencer.followers,
-                'profile_image': influencer.profile_image,
-                'active': influencer.user.active,  # Access user's active status directly
-                'user': {
-                    'id': influencer.user.id,
-                    'username': influencer.user.username,
-                    'email': influencer.user.email,
-                    # Add other user attributes as needed
-                }
-            }
-            influencer_list.append(influencer_data)
+        query = Influencer.query.options(joinedload(Influencer.user))
+        if wants_stream():
+            return stream_json_array(query, influencer_professional_data)
+
+        influencer_list = [influencer_professional_data(influencer) for influencer in query.all()]
         return jsonify(influencer_list)
 
 
 
 class CampaignsAPI(Resource):
-    #@cache.cached(timeout=50)
+    @cached_response('campaign', 'brand')
     def get(self):
-        """Get all campaigns with details."""
+        """Get all campaigns with details. Pass ?stream=1 to stream the list."""
         try:
-            campaigns = []
-            all_campaigns = Campaign.query.all()
-            for campaign in all_campaigns:
-                campaigns.append({
-                    'id': campaign.id,
-                    'title': campaign.title,
-                    'brand_name': campaign.brand.name,
-                    'description': campaign.description,
-                    'start_date': campaign.start_date.strftime('%Y-%m-%d') if campaign.start_date else None,
-                    'end_date': campaign.end_date.strftime('%Y-%m-%d') if campaign.end_date else None,
-                    'budget': campaign.budget,
-                    'status': campaign.status,
-                    'campaign_goals': campaign.campaign_goals,
-                    'target_audience': campaign.target_audience,
-                    'private': campaign.private  # Add the 'private' attribute
-                })
+            query = Campaign.query.options(joinedload(Campaign.brand))
+            if wants_stream():
+                return stream_json_array(query, admin_campaign_data)
 
+            campaigns = [admin_campaign_data(campaign) for campaign in query.all()]
             return make_response(jsonify(campaigns), 200)
 
         except Exception as e:
@@ -1070,69 +1541,9 @@ api.add_resource(InfluencerProfessionalsAPI, '/api/admin/influencer_professional
 
 
 api.add_resource(NicheAPI, '/api/niches')   
-'''
-@socketio.on('join')
-@auth_required('token')
-def on_join(data):
-    
-    """
-    Handles a user joining a chat room.
-    """
-    user = current_user
-    proposal_id = data['proposal_id']
-
-    # Get the influencer and brand related to the proposal
-    proposal = Proposal.query.get(proposal_id)
-    if not proposal:
-        emit('error', {'message': 'Proposal not found'})
-        return
-
-    influencer = proposal.influencer
-    brand = proposal.campaign.brand
-
-    # Check if the user is authorized to join the room
-    # (i.e., if they are the influencer or the brand for this proposal)
-    if (influencer and influencer.user_id != user.id) and (brand and brand.user_id != user.id):
-        emit('error', {'message': 'Unauthorized to join this room'})
-        return
-
-    room_name = f'proposal_{proposal_id}'
-    join_room(room_name)
-    emit('joined', {'message': f'User {user.id} joined room {room_name}'}, room=room_name)
-
-@socketio.on('leave')
-@auth_required('token')
-def on_leave(data):
-    """
-    Handles a user leaving a chat room.
-    """
-    user = current_user
-    proposal_id = data['proposal_id']
-
-    # Get the influencer and brand related to the proposal
-    proposal = Proposal.query.get(proposal_id)
-    if not proposal:
-        emit('error', {'message': 'Proposal not found'})
-        return
-
-    influencer = proposal.influencer
-    brand = proposal.campaign.brand
-
-
-    # Check if the user is authorized to leave the room
-    # (i.e., if they are the influencer or the brand for this proposal)
-    if (influencer and influencer.user_id != user.id) and (brand and brand.user_id != user.id):
-        emit('error', {'message': 'Unauthorized to leave this room'})
-        return
-
-    room_name = f'proposal_{proposal_id}'
-    leave_room(room_name)
-    emit('left', {'message': f'User {user.id} left room {room_name}'}, room=room_name)
-'''
-
-
-
-
+api.add_resource(InfluencerDiscoveryResource, '/api/influencers/discover')
+api.add_resource(RecommendedCampaignsResource, '/api/recommendations/campaigns')
+api.add_resource(RecommendedInfluencersResource, '/api/campaigns/<int:campaign_id>/recommended-influencers')
 class VerifyBrand(Resource):
     # @roles_required('admin')
     def post(self, brand_id):
@@ -1279,13 +1690,14 @@ class ForgotPasswordResource(Resource):
             if not user:
                 return {'message': 'If this email exists, a reset link will be sent'}, 200
             
-            # Generate reset token
+            # Generate reset token, replacing any link sent earlier
             reset_token = secrets.token_urlsafe(32)
-            reset_expires = datetime.utcnow() + timedelta(hours=1)
-            
-            # Store token (you might want to add reset_token and reset_expires columns to User model)
-            # For now, we'll store in fs_uniquifier temporarily (NOT PRODUCTION READY)
-            user.fs_uniquifier = f"reset_{reset_token}_{reset_expires.timestamp()}"
+            PasswordResetToken.query.filter_by(user_id=user.id).delete()
+            db.session.add(PasswordResetToken(
+                user_id=user.id,
+                token_hash=PasswordResetToken.hash_token(reset_token),
+                expires_at=datetime.utcnow() + timedelta(hours=1)
+            ))
             db.session.commit()
             
             # TODO: Send email with reset link
@@ -1308,23 +1720,16 @@ class VerifyResetTokenResource(Resource):
             if not token:
                 return {'message': 'Token is required'}, 400
             
-            # Find user with this token
-            users = User.query.all()
-            for user in users:
-                if user.fs_uniquifier and user.fs_uniquifier.startswith(f'reset_{token}_'):
-                    # Extract expiration from fs_uniquifier
-                    try:
-                        expires_timestamp = float(user.fs_uniquifier.split('_')[2])
-                        expires_datetime = datetime.fromtimestamp(expires_timestamp)
-                        
-                        if datetime.utcnow() > expires_datetime:
-                            return {'message': 'Token has expired'}, 400
-                        
-                        return {'message': 'Token is valid'}, 200
-                    except:
-                        return {'message': 'Invalid token'}, 400
-            
-            return {'message': 'Invalid token'}, 400
+            reset = PasswordResetToken.query.filter_by(
+                token_hash=PasswordResetToken.hash_token(token)
+            ).first()
+            if not reset:
+                return {'message': 'Invalid token'}, 400
+
+            if reset.is_expired():
+                return {'message': 'Token has expired'}, 400
+
+            return {'message': 'Token is valid'}, 200
             
         except Exception as e:
             print(f"Error verifying token: {str(e)}")
@@ -1341,30 +1746,25 @@ class ResetPasswordResource(Resource):
             if not token or not new_password:
                 return {'message': 'Token and password are required'}, 400
             
-            # Find user with this token
-            users = User.query.all()
-            for user in users:
-                if user.fs_uniquifier and user.fs_uniquifier.startswith(f'reset_{token}_'):
-                    # Extract expiration
-                    try:
-                        expires_timestamp = float(user.fs_uniquifier.split('_')[2])
-                        expires_datetime = datetime.fromtimestamp(expires_timestamp)
-                        
-                        if datetime.utcnow() > expires_datetime:
-                            return {'message': 'Token has expired'}, 400
-                        
-                        # Reset password
-                        user.password = hash_password(new_password)
-                        # Clear the reset token
-                        user.fs_uniquifier = secrets.token_urlsafe(16)
-                        db.session.commit()
-                        
-                        return {'message': 'Password reset successful'}, 200
-                    except Exception as e:
-                        print(f"Error parsing token: {str(e)}")
-                        return {'message': 'Invalid token'}, 400
-            
-            return {'message': 'Invalid token'}, 400
+            reset = PasswordResetToken.query.filter_by(
+                token_hash=PasswordResetToken.hash_token(token)
+            ).first()
+            if not reset:
+                return {'message': 'Invalid token'}, 400
+
+            if reset.is_expired():
+                return {'message': 'Token has expired'}, 400
+
+            # Reset password
+            user = reset.user
+            user.password = hash_password(new_password)
+            # Log out existing sessions and auth tokens
+            user.fs_uniquifier = secrets.token_urlsafe(16)
+            # Reset links are single use
+            PasswordResetToken.query.filter_by(user_id=user.id).delete()
+            db.session.commit()
+
+            return {'message': 'Password reset successful'}, 200
             
         except Exception as e:
             print(f"Error resetting password: {str(e)}")
@@ -1382,12 +1782,6 @@ class ChatFileUploadResource(Resource):
             if file.filename == '':
                 return {'message': 'No file selected'}, 400
             
-            # Extended allowed file types for chat
-            CHAT_ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt', 'zip'}
-            
-            def allowed_chat_file(filename):
-                return '.' in filename and filename.rsplit('.', 1)[1].lower() in CHAT_ALLOWED_EXTENSIONS
-            
             if not allowed_chat_file(file.filename):
                 return {'message': 'File type not allowed'}, 400
             
@@ -1396,41 +1790,16 @@ class ChatFileUploadResource(Resource):
             file_size = file.tell()
             file.seek(0)  # Reset file pointer
             
-            if file_size > 10 * 1024 * 1024:  # 10MB
+            if file_size > CHAT_MAX_FILE_SIZE:
                 return {'message': 'File too large. Maximum size is 10MB'}, 400
             
-            # Generate unique filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            original_name = secure_filename(file.filename)
-            file_extension = original_name.rsplit('.', 1)[1].lower()
-            unique_filename = f"chat_{timestamp}_{secrets.token_hex(8)}.{file_extension}"
-            
-            # Create chat uploads directory if it doesn't exist
-            from main import app
-            chat_upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'chat')
-            if not os.path.exists(chat_upload_dir):
-                os.makedirs(chat_upload_dir)
-            
-            # Save file
-            filepath = os.path.join(chat_upload_dir, unique_filename)
-            file.save(filepath)
-            
-            # Determine file type
-            file_type = 'document'
-            if file_extension in ['png', 'jpg', 'jpeg', 'gif']:
-                file_type = 'image'
-            elif file_extension == 'pdf':
-                file_type = 'pdf'
+            # Save file in the content-addressed store (once per distinct file)
+            file_extension = file.filename.rsplit('.', 1)[1].lower()
+            stored = store_stream(file.stream, file_extension)
+            queue_image_derivatives(stored)
             
             # Return file info
-            file_url = f"/uploads/chat/{unique_filename}"
-            
-            return {
-                'file_url': file_url,
-                'file_name': original_name,
-                'file_type': file_type,
-                'file_size': file_size
-            }, 200
+            return chat_attachment(stored, file.filename), 200
             
         except Exception as e:
             print(f"Error uploading file: {str(e)}")
@@ -1439,7 +1808,128 @@ class ChatFileUploadResource(Resource):
             return {'message': f'File upload failed: {str(e)}'}, 500
 
 
+def get_chat_upload(upload_id):
+    """The current user's live upload, or (None, error response)."""
+    upload = ChunkedUpload.query.get(upload_id)
+    if not upload or upload.user_id != current_user.id:
+        return None, make_response(jsonify({'message': 'Upload not found'}), 404)
+    if upload.is_expired():
+        discard_upload(upload)
+        return None, make_response(jsonify({'message': 'Upload expired'}), 410)
+    return upload, None
+
+
+class ChatUploadsResource(Resource):
+    @auth_required('token')
+    def post(self):
+        """
+        Start a resumable chat attachment upload.
+        Body: {"file_name": ..., "file_size": <bytes>}. Then PUT the file in
+        chunks to /api/chat/uploads/<upload_id>?offset=<n>, and POST
+        {"checksum": "<sha256 hex>"} to .../complete.
+        """
+        data = request.get_json() or {}
+        file_name = data.get('file_name') or ''
+        try:
+            file_size = int(data.get('file_size'))
+        except (TypeError, ValueError):
+            return make_response(jsonify({'message': 'file_size is required'}), 400)
+
+        if not allowed_chat_file(file_name):
+            return make_response(jsonify({'message': 'File type not allowed'}), 400)
+        if file_size <= 0 or file_size > CHAT_MAX_FILE_SIZE:
+            return make_response(jsonify({'message': 'File too large. Maximum size is 10MB'}), 400)
+
+        upload = start_upload(current_user.id, file_name, file_size)
+        return make_response(jsonify({
+            'upload_id': upload.id,
+            'offset': 0,
+            'file_size': file_size,
+            'chunk_size': UPLOAD_CHUNK_SIZE,
+            'max_chunk_size': UPLOAD_MAX_CHUNK_SIZE,
+            'expires_at': upload.expires_at.isoformat()
+        }), 201)
+
+
+class ChatUploadResource(Resource):
+    @auth_required('token')
+    def get(self, upload_id):
+        """Where to resume: the number of bytes received so far."""
+        upload, error = get_chat_upload(upload_id)
+        if error:
+            return error
+        return make_response(jsonify({
+            'upload_id': upload.id,
+            'offset': upload.received,
+            'file_size': upload.file_size
+        }), 200)
+
+    @auth_required('token')
+    def put(self, upload_id):
+        """
+        Append the raw request body at ?offset, which must equal the bytes
+        received so far. Answers 409 with the expected offset otherwise.
+        """
+        upload, error = get_chat_upload(upload_id)
+        if error:
+            return error
+
+        try:
+            offset = int(request.args['offset'])
+        except (KeyError, ValueError):
+            return make_response(jsonify({'message': 'offset is required'}), 400)
+        if offset != upload.received:
+            return make_response(jsonify({'message': 'Wrong offset', 'offset': upload.received}), 409)
+
+        length = request.content_length
+        if not length:
+            return make_response(jsonify({'message': 'Content-Length is required'}), 411)
+        if length > UPLOAD_MAX_CHUNK_SIZE or offset + length > upload.file_size:
+            return make_response(jsonify({'message': 'Chunk too large'}), 413)
+
+        try:
+            received = write_chunk(upload, offset, request.stream, length)
+        except ValueError as e:
+            # Connection dropped mid-chunk; the client resumes from offset
+            return make_response(jsonify({'message': str(e), 'offset': offset}), 400)
+        if received is None:
+            db.session.expire(upload)
+            return make_response(jsonify({'message': 'Wrong offset', 'offset': upload.received}), 409)
+
+        return make_response(jsonify({'upload_id': upload.id, 'offset': received}), 200)
+
+
+class ChatUploadCompleteResource(Resource):
+    @auth_required('token')
+    def post(self, upload_id):
+        """Verify the SHA-256 of the received file and publish it as a chat attachment."""
+        upload, error = get_chat_upload(upload_id)
+        if error:
+            return error
+
+        checksum = ((request.get_json(silent=True) or {}).get('checksum') or '').lower()
+        if not checksum:
+            return make_response(jsonify({'message': 'checksum is required'}), 400)
+        if upload.received != upload.file_size:
+            return make_response(jsonify({'message': 'Upload incomplete', 'offset': upload.received}), 409)
+
+        path = temp_path(upload)
+        if file_sha256(path) != checksum:
+            # The bytes on disk are not what the client sent; start over
+            discard_upload(upload)
+            return make_response(jsonify({'message': 'Checksum mismatch, upload discarded'}), 422)
+
+        # ChatUploadsResource.post checked the raw name with allowed_chat_file()
+        extension = upload.file_name.rsplit('.', 1)[1].lower()
+        stored = store_file(path, extension, checksum, upload.file_size)
+        queue_image_derivatives(stored)
+        db.session.delete(upload)
+        db.session.commit()
+        return make_response(jsonify(chat_attachment(stored, upload.file_name)), 200)
+
+
 api.add_resource(InfluencerCampaignResource, '/influencer-campaigns') 
+api.add_resource(CampaignSearchResource, '/api/campaigns/search')
 api.add_resource(InfluencerLogin, '/api/login/influencer')
 api.add_resource(BrandLogin, '/api/login/brand')
 api.add_resource(AdminLogin, '/api/login/admin')
@@ -1450,4 +1940,10 @@ api.add_resource(ProposalsResource, '/api/proposals')
 api.add_resource(ForgotPasswordResource, '/api/auth/forgot-password')
 api.add_resource(VerifyResetTokenResource, '/api/auth/verify-reset-token')
 api.add_resource(ResetPasswordResource, '/api/auth/reset-password')
-api.add_resource(ChatFileUploadResource, '/api/chat/upload')
\ No newline at end of file
+api.add_resource(ChatFileUploadResource, '/api/chat/upload')
+api.add_resource(UnreadCountsResource, '/api/chat/unread')
+api.add_resource(InboxResource, '/api/chat/inbox')
+api.add_resource(ChatSyncResource, '/api/campaigns/<int:campaign_id>/proposals/<int:proposal_id>/chat/since')
+api.add_resource(ChatUploadsResource, '/api/chat/uploads')
+api.add_resource(ChatUploadResource, '/api/chat/uploads/<string:upload_id>')
+api.add_resource(ChatUploadCompleteResource, '/api/chat/uploads/<string:upload_id>/complete')
@@ -7,6 +7,7 @@ import secrets
 
 # Import models
 from models import User, Role, Influencer, Brand, Campaign, Proposal, ChatMessage,Niche, db
+from chat import rebuild_unread_counters
 def initialize_sample_data():
     from main import app  # Import your Flask app instance
     with app.app_context():
@@ -165,6 +166,9 @@ def initialize_sample_data():
 
         # Commit the session to save all changes
         db.session.commit()
+
+        # Recount unread badges for the sample messages
+        rebuild_unread_counters()
         print("Sample data added successfully.")
 
 if __name__ == '__main__':
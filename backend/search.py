@@ -0,0 +1,102 @@
+import re
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import joinedload
+
+# Import models
+from models import db, Campaign
+
+SEARCH_COLUMNS = ('title', 'description', 'campaign_goals', 'target_audience')
+
+_columns = ', '.join(SEARCH_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+
+# SQLite: an external-content FTS5 table over campaign, kept in sync by
+# triggers so every write path (ORM, bulk statements, admin tools) updates it.
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS campaign_fts USING fts5(
+        {_columns}, content='campaign', content_rowid='id', tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS campaign_fts_ai AFTER INSERT ON campaign BEGIN
+        INSERT INTO campaign_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS campaign_fts_ad AFTER DELETE ON campaign BEGIN
+        INSERT INTO campaign_fts(campaign_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS campaign_fts_au AFTER UPDATE ON campaign BEGIN
+        INSERT INTO campaign_fts(campaign_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO campaign_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+]
+
+# Postgres: a GIN expression index, maintained by Postgres itself
+POSTGRES_VECTOR = "to_tsvector('english', {})".format(
+    " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS)
+)
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_campaign_search ON campaign USING GIN ({POSTGRES_VECTOR})",
+]
+
+
+def ensure_search_index(connection):
+    """Create the campaign full-text index on this connection's database if missing."""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'campaign_fts'"
+        )).first()
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if not exists:
+            # Index the campaigns that were written before the index existed
+            connection.execute(text("INSERT INTO campaign_fts(campaign_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+
+
+@event.listens_for(Campaign.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    ensure_search_index(connection)
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def search_campaigns(query, limit, offset=0):
+    """
+    Public campaigns matching every word of `query` (as a prefix), best match
+    first. Returns a list of (campaign, rank) with the brand already loaded.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        sql = text("""
+            SELECT campaign.id, -bm25(campaign_fts) AS rank
+            FROM campaign_fts JOIN campaign ON campaign.id = campaign_fts.rowid
+            WHERE campaign_fts MATCH :match AND NOT coalesce(campaign.private, 0)
+            ORDER BY bm25(campaign_fts)
+            LIMIT :limit OFFSET :offset
+        """)
+        match = ' '.join(f'"{term}"*' for term in terms)
+    elif dialect == 'postgresql':
+        sql = text(f"""
+            SELECT id, ts_rank({POSTGRES_VECTOR}, to_tsquery('english', :match)) AS rank
+            FROM campaign
+            WHERE {POSTGRES_VECTOR} @@ to_tsquery('english', :match) AND NOT coalesce(private, false)
+            ORDER BY rank DESC, id
+            LIMIT :limit OFFSET :offset
+        """)
+        match = ' & '.join(f'{term}:*' for term in terms)
+    else:
+        raise RuntimeError(f'Full-text search is not supported on {dialect}')
+
+    ranked = db.session.execute(sql, {'match': match, 'limit': limit, 'offset': offset}).all()
+    campaigns = Campaign.query.options(joinedload(Campaign.brand)) \
+        .filter(Campaign.id.in_([row.id for row in ranked])).all()
+    by_id = {campaign.id: campaign for campaign in campaigns}
+    return [(by_id[row.id], row.rank) for row in ranked if row.id in by_id]
@@ -1,5 +1,8 @@
 from celery import shared_task
 from models import *
+from matching import refresh_recommendations
+from uploads import discard_upload, is_image, purge_unreferenced_files
+from images import process_missing_derivatives, process_stored_image
 import flask_excel as excel
 import csv
 from smtplib import SMTP
@@ -125,6 +128,76 @@ def daily_reminder():
 
 
 
+@shared_task(ignore_result=True)
+def purge_expired_reset_tokens():
+    """Delete password reset tokens whose link has expired."""
+    purged = PasswordResetToken.query.filter(
+        PasswordResetToken.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return f"Purged {purged} expired reset tokens"
+
+
+
+
+
+
+@shared_task(ignore_result=True)
+def purge_expired_uploads():
+    """Delete resumable chat uploads that were never completed, with their temp files."""
+    expired = ChunkedUpload.query.filter(ChunkedUpload.expires_at < datetime.utcnow()).all()
+    for upload in expired:
+        discard_upload(upload)
+    return f"Purged {len(expired)} expired uploads"
+
+
+
+@shared_task(ignore_result=True)
+def sweep_unreferenced_files():
+    """Delete stored upload files that no profile or chat message points at any more."""
+    removed = purge_unreferenced_files()
+    return f"Removed {removed} unreferenced files"
+
+
+
+@shared_task(ignore_result=True)
+def make_image_derivatives(path):
+    """Make the resized, metadata-free thumbnails of a newly stored image."""
+    written = process_stored_image(path)
+    return f"Wrote {written} thumbnails of {path}"
+
+
+
+@shared_task(ignore_result=True)
+def make_missing_image_derivatives():
+    """Catch up on stored images whose thumbnail task was lost or never queued."""
+    processed = process_missing_derivatives()
+    return f"Made thumbnails of {processed} images"
+
+
+def queue_image_derivatives(stored):
+    """Queue make_image_derivatives for a StoredFile that is an image without thumbnails."""
+    if not is_image(stored.path) or stored.derivatives_at is not None:
+        return
+    try:
+        make_image_derivatives.delay(stored.path)
+    except Exception as e:
+        # Thumbnail URLs redirect to the original until the backfill runs
+        print(f"Could not queue thumbnails of {stored.path}: {e}")
+
+
+
+@shared_task(ignore_result=True)
+def refresh_match_recommendations():
+    """Recompute the precomputed influencer/campaign top-K match lists."""
+    written = refresh_recommendations()
+    return f"Stored {written} match recommendations"
+
+
+
+
+
+
 @shared_task(ignore_result=True)
 def monthly_reminder():
     # --- Send reminders to Influencers ---
@@ -0,0 +1,157 @@
+"""
+Query budgets for the listing endpoints. Each endpoint must run a fixed
+number of statements however many rows it returns, so an N+1 regression
+(a lazy load inside a loop) fails here instead of in production.
+
+Run from backend/:  python -m pytest test_query_budgets.py
+(conftest.py points the app at a temporary database first.)
+"""
+import secrets
+from datetime import datetime, timedelta
+
+import pytest
+from flask_security.utils import hash_password
+
+from main import app
+from models import db, Brand, Campaign, ChatMessage, Influencer, Proposal, Role, User
+from chat import rebuild_unread_counters
+from querystats import assert_query_budget
+from sample_data import initialize_sample_data
+
+# Rows seeded on top of the sample data. The budgets below must hold for
+# any value; raising it is a quick way to check a suspected N+1.
+EXTRA_ROWS = 10
+
+
+def _user(username, user_type, role):
+    user = User(
+        username=username,
+        email=f'{username}@example.com',
+        password=hash_password('password'),
+        type=user_type,
+        active=True,
+        fs_uniquifier=secrets.token_urlsafe(16),
+    )
+    user.roles.append(role)
+    db.session.add(user)
+    return user
+
+
+def _seed():
+    brand = Brand.query.join(User).filter(User.username == 'brand1').one()
+    influencer = Influencer.query.join(User).filter(User.username == 'influencer1').one()
+    influencer_role = Role.query.filter_by(name='influencer').one()
+    brand_role = Role.query.filter_by(name='brand').one()
+    campaign = Campaign.query.filter_by(brand_id=brand.id).first()
+    proposal = Proposal.query.filter_by(campaign_id=campaign.id, influencer_id=influencer.id).first()
+    start = datetime(2024, 1, 1)
+
+    for i in range(EXTRA_ROWS):
+        user = _user(f'budget_influencer{i}', 'influencer', influencer_role)
+        other = Influencer(user=user, bio='bio', niche='Tech', followers=1000 * (i + 1))
+        db.session.add(other)
+
+        brand_user = _user(f'budget_brand{i}', 'brand', brand_role)
+        db.session.add(Brand(user=brand_user, name=f'Budget Brand {i}', industry='Tech'))
+
+        extra = Campaign(
+            brand_id=brand.id, title=f'Budget campaign {i}', description='description',
+            start_date=start, end_date=start + timedelta(days=30), budget=500 + i,
+            status='open', private=False,
+        )
+        db.session.add(extra)
+        db.session.flush()
+
+        db.session.add(Proposal(campaign_id=campaign.id, influencer_id=other.id,
+                                status='pending', bid_amount=100 + i, proposed_by='influencer'))
+        conversation = Proposal(campaign_id=extra.id, influencer_id=influencer.id,
+                                status='pending', bid_amount=200 + i, proposed_by='brand')
+        db.session.add(conversation)
+        db.session.flush()
+
+        # One more conversation in both users' inboxes
+        db.session.add(ChatMessage(proposal_id=conversation.id, sender_id=brand.user_id,
+                                   recipient_id=influencer.user_id, message=f'offer {i}',
+                                   timestamp=start + timedelta(hours=i)))
+
+        sender, recipient = (brand.user_id, influencer.user_id) if i % 2 else (influencer.user_id, brand.user_id)
+        db.session.add(ChatMessage(proposal_id=proposal.id, sender_id=sender, recipient_id=recipient,
+                                   message=f'message {i}', timestamp=start + timedelta(minutes=i)))
+    db.session.commit()
+    rebuild_unread_counters()
+    return campaign.id, proposal.id
+
+
+@pytest.fixture(scope='module')
+def env():
+    app.config['TESTING'] = True
+    # Measure the views themselves, not the response cache
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    initialize_sample_data()
+    with app.app_context():
+        campaign_id, proposal_id = _seed()
+        tokens = {
+            name: User.query.filter_by(username=name).one().get_auth_token()
+            for name in ('influencer1', 'brand1', 'admin')
+        }
+    return {
+        'client': app.test_client(),
+        'headers': {name: {'Authentication-Token': token} for name, token in tokens.items()},
+        'campaign_id': campaign_id,
+        'proposal_id': proposal_id,
+    }
+
+
+def _check(env, user, url, budget):
+    response = assert_query_budget(env['client'], url, budget, headers=env['headers'][user])
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response
+
+
+def test_brand_campaigns(env):
+    _check(env, 'brand1', '/api/campaigns', 3)
+
+
+def test_influencer_campaigns(env):
+    _check(env, 'influencer1', '/influencer-campaigns', 3)
+
+
+def test_campaign_search(env):
+    _check(env, 'influencer1', '/api/campaigns/search?q=Budget', 3)
+
+
+def test_admin_campaigns(env):
+    _check(env, 'admin', '/api/admin/campaigns', 2)
+
+
+def test_admin_brand_list(env):
+    _check(env, 'admin', '/api/admin/brand_professionals', 2)
+
+
+def test_admin_influencer_list(env):
+    _check(env, 'admin', '/api/admin/influencer_professionals', 2)
+
+
+def test_influencer_discovery(env):
+    _check(env, 'brand1', '/api/influencers/discover', 2)
+
+
+def test_campaign_proposals(env):
+    _check(env, 'brand1', f"/api/campaigns/{env['campaign_id']}/proposals", 3)
+
+
+def test_influencer_proposals(env):
+    _check(env, 'influencer1', '/api/proposals', 3)
+
+
+def test_chat_messages(env):
+    _check(env, 'influencer1',
+           f"/api/campaigns/{env['campaign_id']}/proposals/{env['proposal_id']}/chat", 4)
+
+
+def test_chat_inbox(env):
+    _check(env, 'brand1', '/api/chat/inbox', 3)
+
+
+def test_chat_unread(env):
+    _check(env, 'influencer1', '/api/chat/unread', 2)
@@ -0,0 +1,46 @@
+"""
+Emits from outside a Socket.IO handler (tasks, scripts) reach the clients
+in a room. Without SOCKETIO_MESSAGE_QUEUE, emit_to_room() uses this
+process's server, which Flask-SocketIO's test client can connect to.
+"""
+import pytest
+
+from main import app, socketio
+from models import Proposal, User
+from realtime import emit_to_room
+from sample_data import initialize_sample_data
+
+
+@pytest.fixture
+def chat():
+    initialize_sample_data()
+    with app.app_context():
+        token = User.query.filter_by(username='brand1').one().get_auth_token()
+        proposal = Proposal.query.first()
+        ids = {'campaign_id': proposal.campaign_id, 'proposal_id': proposal.id}
+    client = socketio.test_client(app, auth={'token': token})
+    assert client.is_connected()
+    client.emit('join_chat', ids)
+    client.get_received()
+    yield client, f"chat_{ids['campaign_id']}_{ids['proposal_id']}"
+    client.disconnect()
+
+
+def test_emit_to_room_reaches_joined_client(chat):
+    client, room = chat
+    assert emit_to_room('proposal_updated', {'status': 'accepted'}, room)
+
+    received = [event for event in client.get_received() if event['name'] == 'proposal_updated']
+    assert received == [{'name': 'proposal_updated', 'args': [{'status': 'accepted'}], 'namespace': '/'}]
+
+
+def test_emit_to_room_skips_other_rooms(chat):
+    client, room = chat
+    assert emit_to_room('proposal_updated', {'status': 'accepted'}, room + '_other')
+
+    assert not [event for event in client.get_received() if event['name'] == 'proposal_updated']
+
+
+def test_connection_without_token_is_refused():
+    client = socketio.test_client(app)
+    assert not client.is_connected()
@@ -0,0 +1,324 @@
+import hashlib
+import os
+import secrets
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, inspect, select, update
+from werkzeug.utils import secure_filename
+
+from chat import upsert
+# Import models
+from models import db, Brand, ChatMessage, ChunkedUpload, Influencer, StoredFile
+
+CHAT_ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt', 'zip'}
+CHAT_MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Resumable uploads: the client sends the file as PUTs of at most
+# UPLOAD_MAX_CHUNK_SIZE bytes, each written to disk STREAM_BUFFER_SIZE bytes
+# at a time, so a worker holds at most one buffer per upload in memory.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 4 * 1024 * 1024
+STREAM_BUFFER_SIZE = 64 * 1024
+UPLOAD_EXPIRY = timedelta(hours=24)
+
+# Content-addressed store: every distinct file is kept once, under
+# UPLOAD_FOLDER/blobs/<2 hex>/<2 hex>/<sha256>.<ext>, and served as
+# /uploads/blobs/... A file nobody references is only removed once it has
+# not been uploaded again for UNREFERENCED_GRACE, which leaves time for the
+# row that will use it (e.g. the chat message) to be written.
+BLOB_DIR = 'blobs'
+UNREFERENCED_GRACE = timedelta(hours=1)
+
+# Resized, metadata-free WebP copies of stored images (see images.py), at
+# UPLOAD_FOLDER/thumbs/<size>/<2 hex>/<2 hex>/<sha256>.<ext>.webp. Like the
+# blobs they are named after, they never change once written.
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+THUMBNAIL_DIR = 'thumbs'
+AVATAR_SIZE = 256   # profile images in lists and dashboards
+PREVIEW_SIZE = 640  # images shown inline in chat
+THUMBNAIL_SIZES = (PREVIEW_SIZE, AVATAR_SIZE)
+
+
+def allowed_chat_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in CHAT_ALLOWED_EXTENSIONS
+
+
+def chat_file_type(extension):
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    if extension == 'pdf':
+        return 'pdf'
+    return 'document'
+
+
+def _folder(key):
+    folder = current_app.config[key]
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return folder
+
+
+def temp_path(upload):
+    # Kept out of UPLOAD_FOLDER, which is served publicly
+    return os.path.join(_folder('UPLOAD_TEMP_FOLDER'), f'{upload.id}.part')
+
+
+def start_upload(user_id, file_name, file_size):
+    """Create a ChunkedUpload and its empty temp file."""
+    upload = ChunkedUpload(
+        id=secrets.token_urlsafe(24),
+        user_id=user_id,
+        file_name=file_name,
+        file_size=file_size,
+        received=0,
+        expires_at=datetime.utcnow() + UPLOAD_EXPIRY,
+    )
+    open(temp_path(upload), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Write `length` bytes from `stream` at `offset` of the temp file and
+    record them. Anything past `offset` left by an interrupted earlier
+    attempt is overwritten. Returns the new offset, or None if another
+    request moved the upload on first.
+    """
+    path = temp_path(upload)
+    written = 0
+    with open(path, 'r+b') as part:
+        part.seek(offset)
+        part.truncate()
+        while written < length:
+            buffer = stream.read(min(STREAM_BUFFER_SIZE, length - written))
+            if not buffer:
+                break
+            part.write(buffer)
+            written += len(buffer)
+        part.flush()
+        os.fsync(part.fileno())
+    if written != length:
+        raise ValueError(f'Chunk ended after {written} of {length} bytes')
+
+    # Only advance from the offset this request started at
+    moved = ChunkedUpload.query.filter_by(id=upload.id, received=offset) \
+        .update({'received': offset + written}, synchronize_session=False)
+    db.session.commit()
+    return offset + written if moved else None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for buffer in iter(lambda: f.read(STREAM_BUFFER_SIZE), b''):
+            digest.update(buffer)
+    return digest.hexdigest()
+
+
+def blob_path(value):
+    """The store path a profile_image or file_url value points at, or None."""
+    if not value:
+        return None
+    value = value.lstrip('/')
+    if value.startswith('uploads/'):
+        value = value[len('uploads/'):]
+    return value if value.startswith(f'{BLOB_DIR}/') else None
+
+
+def is_image(path):
+    return path.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+
+def thumbnail_path(path, size):
+    return f'{THUMBNAIL_DIR}/{size}/{path[len(BLOB_DIR) + 1:]}.webp'
+
+
+def thumbnail_source(thumbnail):
+    """The stored file a thumbnail path was made from, or None."""
+    parts = thumbnail.split('/', 2)
+    if len(parts) != 3 or parts[0] != THUMBNAIL_DIR or not parts[2].endswith('.webp'):
+        return None
+    return f'{BLOB_DIR}/{parts[2][:-len(".webp")]}'
+
+
+def thumbnail_url(value, size):
+    """
+    The `size` thumbnail URL for a profile_image or file_url value, with the
+    same prefix, or None if it isn't a stored image. Until the thumbnail has
+    been made, the URL redirects to the original.
+    """
+    path = blob_path(value)
+    if path is None or not is_image(path):
+        return None
+    return value[:-len(path)] + thumbnail_path(path, size)
+
+
+def store_file(source, extension, digest, size):
+    """
+    Move a local file with a known SHA-256 into the store, or drop it if
+    the same content is already there. Returns its StoredFile.
+    """
+    path = f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{extension.lower()}'
+
+    # Recorded before the file is placed, so the sweeper's grace period
+    # covers this upload even if the content was unreferenced until now
+    stmt = upsert(StoredFile).values(
+        path=path, digest=digest, size=size, ref_count=0, last_stored_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StoredFile.path],
+        set_={'last_stored_at': stmt.excluded.last_stored_at},
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+    destination = os.path.join(_folder('UPLOAD_FOLDER'), path)
+    if os.path.exists(destination):
+        os.remove(source)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(source, destination)
+    return db.session.get(StoredFile, path)
+
+
+def store_stream(stream, extension):
+    """Copy an incoming file into the store, hashing it on the way. Returns its StoredFile."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp = tempfile.mkstemp(dir=_folder('UPLOAD_TEMP_FOLDER'), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for buffer in iter(lambda: stream.read(STREAM_BUFFER_SIZE), b''):
+                digest.update(buffer)
+                out.write(buffer)
+                size += len(buffer)
+        return store_file(temp, extension, digest.hexdigest(), size)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def chat_attachment(stored, original_name):
+    """The attachment fields a chat message carries for a stored file."""
+    # The stored path's extension passed allowed_chat_file(); the sanitized
+    # name may have lost it (secure_filename('отчёт.pdf') == 'pdf')
+    extension = stored.path.rsplit('.', 1)[1]
+    file_name = secure_filename(original_name)
+    if not file_name.lower().endswith(f'.{extension}'):
+        file_name = f'attachment.{extension}'
+    return {
+        'file_url': f'/uploads/{stored.path}',
+        'file_name': file_name,
+        'file_type': chat_file_type(extension),
+        'file_size': stored.size
+    }
+
+
+def change_references(connection, values, delta):
+    """Add `delta` to the ref_count of every stored file among `values`."""
+    for path, count in Counter(filter(None, map(blob_path, values))).items():
+        # Core table: reference counts never invalidate cached responses
+        connection.execute(
+            update(StoredFile.__table__)
+            .where(StoredFile.__table__.c.path == path)
+            .values(ref_count=StoredFile.__table__.c.ref_count + count * delta)
+        )
+
+
+# Columns that point at stored files. The write-behind chat writer inserts
+# without the ORM and counts its references itself.
+REFERENCE_COLUMNS = (
+    (Influencer, 'profile_image', 'uploads/'),
+    (Brand, 'profile_image', 'uploads/'),
+    (ChatMessage, 'file_url', '/uploads/'),
+)
+
+
+def _track_references(model, attribute):
+    @event.listens_for(model, 'after_insert')
+    def _inserted(mapper, connection, target):
+        change_references(connection, [getattr(target, attribute)], 1)
+
+    @event.listens_for(model, 'after_delete')
+    def _deleted(mapper, connection, target):
+        change_references(connection, [getattr(target, attribute)], -1)
+
+    @event.listens_for(model, 'after_update')
+    def _updated(mapper, connection, target):
+        history = inspect(target).attrs[attribute].history
+        if history.has_changes():
+            change_references(connection, history.deleted, -1)
+            change_references(connection, history.added, 1)
+
+
+for _model, _attribute, _prefix in REFERENCE_COLUMNS:
+    _track_references(_model, _attribute)
+
+
+def _actual_references(paths):
+    """How many rows really point at each of `paths`."""
+    counts = Counter()
+    for model, attribute, prefix in REFERENCE_COLUMNS:
+        column = getattr(model, attribute)
+        values = db.session.execute(
+            select(column).where(column.in_([prefix + path for path in paths]))
+        ).scalars()
+        counts.update(blob_path(value) for value in values)
+    return counts
+
+
+def purge_unreferenced_files():
+    """
+    Delete stored files that no row references and nobody uploaded within
+    UNREFERENCED_GRACE. Reference counts are checked against the rows first,
+    so a drifted counter is corrected rather than trusted. Returns the
+    number of files removed.
+    """
+    cutoff = datetime.utcnow() - UNREFERENCED_GRACE
+    table = StoredFile.__table__
+    candidates = db.session.execute(
+        select(table.c.path).where(table.c.ref_count <= 0, table.c.last_stored_at < cutoff)
+    ).scalars().all()
+    if not candidates:
+        return 0
+
+    referenced = _actual_references(candidates)
+    for path, count in referenced.items():
+        db.session.execute(update(table).where(table.c.path == path).values(ref_count=count))
+    db.session.commit()
+
+    removed = 0
+    for path in candidates:
+        if path in referenced:
+            continue
+        # Re-check in the DELETE itself: the file may have been uploaded again
+        deleted = db.session.execute(
+            delete(table).where(table.c.path == path, table.c.ref_count <= 0,
+                                table.c.last_stored_at < cutoff)
+        ).rowcount
+        db.session.commit()
+        if deleted:
+            derived = [thumbnail_path(path, size) for size in THUMBNAIL_SIZES] if is_image(path) else []
+            for name in [path] + derived:
+                try:
+                    os.remove(os.path.join(_folder('UPLOAD_FOLDER'), name))
+                except FileNotFoundError:
+                    pass
+            removed += 1
+    return removed
+
+
+def discard_upload(upload):
+    """Delete an upload's row and temp file."""
+    try:
+        os.remove(temp_path(upload))
+    except FileNotFoundError:
+        pass
+    db.session.delete(upload)
+    db.session.commit()
@@ -72,7 +72,7 @@ const BrandDashboard = () => {
   };
 
   const profileImageURL = userData?.profile_image 
-    ? `${baseURL}/${userData.profile_image}` 
+    ? `${baseURL}/${userData.profile_thumbnail || userData.profile_image}` 
     : null;
 
   return (
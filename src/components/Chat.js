@@ -17,7 +17,10 @@ const Chat = () => {
   const [selectedFile, setSelectedFile] = useState(null);
   const [uploadingFile, setUploadingFile] = useState(false);
   const [filePreview, setFilePreview] = useState(null);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const messagesEndRef = useRef(null);
+  const lastMessageIdRef = useRef(null);
   const socketRef = useRef(null);
   const fileInputRef = useRef(null);
   const typingTimeoutRef = useRef(null);
@@ -28,6 +31,7 @@ const Chat = () => {
     // Initialize Socket.IO connection
     const socketUrl = process.env.REACT_APP_SOCKET_URL || 'http://localhost:5000';
     socketRef.current = io(socketUrl, {
+      auth: { token: localStorage.getItem('auth_token') },
       transports: ['websocket', 'polling'],
       reconnection: true,
       reconnectionAttempts: 5,
@@ -115,7 +119,12 @@ const Chat = () => {
   }, [campaignId, proposalId]); // eslint-disable-line react-hooks/exhaustive-deps
 
   useEffect(() => {
-    scrollToBottom();
+    // Only follow new messages at the bottom, not older pages loaded above
+    const lastId = messages.length > 0 ? messages[messages.length - 1].id : null;
+    if (lastId !== lastMessageIdRef.current) {
+      lastMessageIdRef.current = lastId;
+      scrollToBottom();
+    }
   }, [messages]);
 
   const scrollToBottom = () => {
@@ -146,11 +155,12 @@ const Chat = () => {
         setProposalDetails(proposal);
       }
 
-      // Fetch existing messages
+      // Fetch the newest page of messages; older ones are loaded on demand
       const messagesResponse = await authenticatedFetch(`/campaigns/${campaignId}/proposals/${proposalId}/chat`);
       if (messagesResponse.ok) {
         const data = await messagesResponse.json();
         setMessages(data.messages || data || []);
+        setOlderCursor(data.next_cursor || null);
       }
 
       setIsLoading(false);
@@ -161,6 +171,25 @@ const Chat = () => {
     }
   };
 
+  const loadOlderMessages = async () => {
+    if (!olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const response = await authenticatedFetch(
+        `/campaigns/${campaignId}/proposals/${proposalId}/chat?before=${encodeURIComponent(olderCursor)}`
+      );
+      if (response.ok) {
+        const data = await response.json();
+        setMessages(prev => [...(data.messages || []), ...prev]);
+        setOlderCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const markMessagesAsRead = (messageIds) => {
     if (socketRef.current && isConnected && messageIds.length > 0) {
       socketRef.current.emit('mark_read', {
@@ -329,7 +358,7 @@ const Chat = () => {
       return (
         <div className="message-image">
           <a href={`${process.env.REACT_APP_API_URL || 'http://localhost:5000'}${message.file_url}`} target="_blank" rel="noopener noreferrer">
-            <img src={`${process.env.REACT_APP_API_URL || 'http://localhost:5000'}${message.file_url}`} alt={message.file_name} />
+            <img src={`${process.env.REACT_APP_API_URL || 'http://localhost:5000'}${message.thumbnail_url || message.file_url}`} alt={message.file_name} />
           </a>
           <div className="file-info">
             <span className="file-name">{message.file_name}</span>
@@ -403,6 +432,11 @@ const Chat = () => {
       </div>
 
       <div className="chat-messages">
+        {olderCursor && (
+          <button className="load-older-messages" onClick={loadOlderMessages} disabled={loadingOlder}>
+            {loadingOlder ? 'Loading...' : 'Load earlier messages'}
+          </button>
+        )}
         {messages.length > 0 ? (
           messages.map((message, index) => (
             <div 
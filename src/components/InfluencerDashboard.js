@@ -108,7 +108,7 @@ const InfluencerDashboard = () => {
   };
 
   const profileImageURL = influencer?.profile_image
-    ? `${API_BASE_URL}/${influencer.profile_image}`
+    ? `${API_BASE_URL}/${influencer.profile_thumbnail || influencer.profile_image}`
     : null;
 
   return (